@@ -0,0 +1,88 @@
+/* Temperature forecast
+––––––––––––––––––––––––––––––––––––––––––––––––––
+The server sends the forecast as compact data (see Frontend.get_forecast_data),
+or only the changes to the forecast shown (see Frontend.get_forecast_patch).
+The graph is drawn here from the forecast kept in the browser.
+*/
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    wettermonitor: {
+        draw_forecast: function(message) {
+            var no_update = window.dash_clientside.no_update;
+            if (!message) {
+                return [no_update, no_update];
+            }
+
+            var forecast = window.wettermonitorForecast;
+            if (message.type === 'patch') {
+                // a patch only applies to the forecast it was calculated from, the server sends the whole forecast next time
+                if (!forecast || forecast.version !== message.base) {
+                    window.wettermonitorForecast = null;
+                    return [no_update, null];
+                }
+                forecast = applyForecastPatch(forecast, message);
+            } else {
+                forecast = message;
+            }
+
+            window.wettermonitorForecast = forecast;
+            return [getForecastFigure(forecast), forecast.version];
+        }
+    }
+});
+
+function applyForecastPatch(forecast, patch) {
+    // drop the values before the new start, keep the following ones, replace the changed ones and append the new ones
+    var series = {};
+    Object.keys(patch.series).forEach(function(name) {
+        var change = patch.series[name];
+        var values = forecast.series[name].slice(patch.shift, patch.shift + change.keep);
+        change.set.forEach(function(position_value) {
+            values[position_value[0]] = position_value[1];
+        });
+        series[name] = values.concat(change.append);
+    });
+
+    return {
+        version: patch.version,
+        start: patch.start,
+        step: forecast.step,
+        offset: patch.offset,
+        series: series,
+        band: forecast.band
+    };
+}
+
+function getForecastFigure(forecast) {
+    // values are relative to the current temperature (offset), one every step milliseconds from start on
+    function getTrace(name) {
+        var values = forecast.series[name];
+        return {
+            x: values.map(function(value, position) { return forecast.start + position * forecast.step; }),
+            y: values.map(function(value) { return value === null ? null : Math.round((value + forecast.offset) * 100) / 100; }),
+            mode: 'lines',
+            connectgaps: true
+        };
+    }
+
+    var data;
+    if (forecast.band) {
+        // band between the percentiles with the median on top
+        data = [
+            Object.assign(getTrace('lower'), {line: {width: 0}, showlegend: false, hoverinfo: 'skip'}),
+            Object.assign(getTrace('upper'), {line: {width: 0}, fill: 'tonexty', fillcolor: 'rgba(0, 0, 255, 0.2)', name: forecast.band}),
+            Object.assign(getTrace('median'), {line: {color: 'blue'}, name: 'Median'})
+        ];
+    } else {
+        data = [Object.assign(getTrace('air_temperature'), {line: {color: 'blue'}, name: 'Air Temperature', showlegend: false})];
+    }
+
+    return {
+        data: data,
+        layout: {
+            title: {text: 'Temperature Forecast'},
+            xaxis: {title: {text: 'Time'}, type: 'date'},
+            yaxis: {title: {text: 'Air Temperature'}}
+        }
+    };
+}
@@ -1,15 +1,15 @@
 #!/bin/bash
 
-# wait for a few seconds to be sure python is fully loaded
-sleep 5s
-
 # change directory to project folder
 cd $(dirname $0)
 # run wettermonitor
 python3 /home/user/wettermonitor/Main.py &
 
-# wait a few seconds for the server to start
-sleep 3s
+# wait until the server serves the user interface (at most 60 seconds), the data is loaded in the background
+for attempt in $(seq 1 120); do
+    curl --silent --fail --output /dev/null http://localhost:8050/ready && break
+    sleep 0.5s
+done
 
 # start chromium browser in fullscreen and display the application
 chromium --kiosk http://localhost:8050/ &
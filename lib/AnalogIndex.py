@@ -0,0 +1,337 @@
+import threading
+import warnings
+import os
+import numpy as np
+
+
+class AnalogIndex:
+
+    def __init__(self, storage, field = 'air_temperature', intervals = 29, horizon = 30, chunk_size = 65536):
+        """ (object, object, string, int, int, int) -> void
+        Constructor of AnalogIndex. Keeps the mean of all stations of the given field of the local storage
+        as one float32 file on the same 10 minute grid, so every window of intervals observations is a view on it.
+        Analogs are only searched where the following horizon observations are known.
+        Candidates are scored chunk_size at a time to keep the memory usage bounded.
+        """
+        self.storage = storage
+        self.field = field
+        self.intervals = intervals
+        self.horizon = horizon
+        self.chunk_size = chunk_size
+
+        # weight according to elapsed time, the most recent interval weighs most (same as Prediction.score_candidates)
+        self.weights = (intervals + 1 - np.arange(intervals)).astype(np.float32)
+
+        # sums of every block of block_size slots by its last slot, plain and weighted by the distance to the last slot
+        # (nan if a value is missing), valid up to features_valid_until
+        self.block_size = 4
+        self.sums = np.empty(0, dtype=np.float32)
+        self.distance_sums = np.empty(0, dtype=np.float32)
+        self.features_valid_until = 0
+        self.first_valid = 0
+        self.lock = threading.Lock()
+
+    def get_path(self):
+        """ (object) -> string
+        This function returns the file path of the index.
+        """
+        return os.path.join(self.storage.folder, f'index_{self.field}.f32')
+
+    def get_values(self):
+        """ (object) -> object
+        This function returns the read only memory map of the station means or None if the index has not been built yet.
+        """
+        return self.storage.open_file(self.get_path())
+
+    def update(self, changed = None, overlap = 18):
+        """ (object, dict, int) -> void
+        This function builds the index or extends it with the new observations of the storage.
+        The last overlap slots and all slots after the first changed slot of every station (see Storage.update_rollups) are calculated again.
+        """
+        arrays = [array for array in (self.storage.get_array(station, self.field) for station in self.storage.stations) if array is not None]
+        if len(arrays) == 0:
+            return
+        end = max(len(array) for array in arrays)
+
+        # continue with the last slots, they may have been incomplete
+        values = self.get_values()
+        start = 0 if values is None else max(len(values) - overlap, 0)
+        if changed:
+            start = min(start, min(changed.values()))
+
+        # calculate one year at a time
+        for chunk_start in range(start, end, 52560):
+            chunk_end = min(chunk_start + 52560, end)
+            stacked = np.full((len(arrays), chunk_end - chunk_start), np.nan, dtype=np.float32)
+            for row, array in enumerate(arrays):
+                available = array[chunk_start:chunk_end]
+                stacked[row, :len(available)] = available
+
+            with warnings.catch_warnings():
+                # slots without any station stay nan
+                warnings.simplefilter('ignore', category=RuntimeWarning)
+                means = np.nanmean(stacked, axis=0)
+
+            self.storage.write_file(self.get_path(), np.arange(chunk_start, chunk_end), means)
+
+        # the features of windows with changed slots are calculated again
+        with self.lock:
+            self.features_valid_until = min(self.features_valid_until, start)
+
+    def get_features(self, values):
+        """ (object, object) -> object, object
+        This function returns the block sums (see the constructor) of every slot of the given values.
+        They are calculated once and extended with the slots added or changed since.
+        """
+        with self.lock:
+            start = min(self.features_valid_until, len(self.sums))
+            if start >= len(values):
+                return self.sums[:len(values)], self.distance_sums[:len(values)]
+
+            # blocks ending from start on, their values begin block_size - 1 slots earlier
+            first = max(start - (self.block_size - 1), 0)
+            block_values = np.asarray(values[first:], dtype=np.float64)
+            missing = np.isnan(block_values)
+            block_values[missing] = 0
+            sums = np.convolve(block_values, np.ones(self.block_size), 'valid')
+            distance_sums = np.convolve(block_values, np.arange(self.block_size, dtype=np.float64), 'valid')
+            incomplete = np.convolve(missing, np.ones(self.block_size), 'valid') > 0
+            sums[incomplete] = np.nan
+            distance_sums[incomplete] = np.nan
+
+            # the first blocks of the grid are incomplete
+            features = []
+            for old_features, new_features in [(self.sums, sums), (self.distance_sums, distance_sums)]:
+                extended = np.full(len(values), np.nan, dtype=np.float32)
+                extended[:start] = old_features[:start]
+                extended[first + self.block_size - 1:] = new_features
+                features.append(extended)
+            self.sums, self.distance_sums = features
+            self.features_valid_until = len(values)
+
+            # slot of the first value, windows before it are empty
+            present = ~np.isnan(self.sums)
+            self.first_valid = int(np.argmax(present)) - (self.block_size - 1) if present.any() else len(values)
+            return self.sums, self.distance_sums
+
+    def get_cache_size(self):
+        """ (object) -> int
+        This function returns the size in bytes of the block sums.
+        """
+        with self.lock:
+            return self.sums.nbytes + self.distance_sums.nbytes
+
+    def clear_cache(self):
+        """ (object) -> void
+        This function drops the block sums, the next search calculates them again.
+        """
+        with self.lock:
+            self.sums = np.empty(0, dtype=np.float32)
+            self.distance_sums = np.empty(0, dtype=np.float32)
+            self.features_valid_until = 0
+
+    def get_bounds(self, values, ends, current):
+        """ (object, object, object, object) -> object
+        This function returns a lower bound of the score of every window ending at the given slots (a range of slots).
+        Every block of the window adds the difference of its weighted sum to the one of the current values (triangle inequality),
+        blocks with missing values on either side add nothing.
+        """
+        sums, distance_sums = self.get_features(values)
+        bounds = np.zeros(len(ends), dtype=np.float32)
+        if len(ends) == 0:
+            return bounds
+
+        # a range of slots is read as a view, other slots one by one
+        step = ends[1] - ends[0] if len(ends) > 1 else 1
+        is_range = step > 0 and bool(np.all(np.diff(ends) == step))
+        for block_start in range(0, self.intervals - self.block_size + 1, self.block_size):
+            block = slice(block_start, block_start + self.block_size)
+            if np.isnan(current[block]).any():
+                continue
+
+            # weights of the block are the weight of its newest slot minus the distance to it
+            block_ends = slice(ends[0] - block_start, ends[-1] - block_start + 1, step) if is_range else ends - block_start
+            differences = sums[block_ends] * self.weights[block_start]
+            differences -= distance_sums[block_ends]
+            differences -= np.dot(self.weights[block], current[block])
+            np.abs(differences, out=differences)
+            bounds += np.nan_to_num(differences, copy=False, nan=0)
+        return bounds
+
+    def get_hour_ranges(self):
+        """ (object) -> object, object
+        This function returns the lowest and highest value every hour of the station means can take, from the hourly rollups
+        of the storage (the lowest minimum and highest maximum of all stations). Hours where no station has a value in every slot
+        (see the counts of the rollups) are nan, some of their slots may be missing in the index.
+        It returns None if there are no rollups.
+        """
+        slots = self.storage.rollups['1h']
+        stations = []
+        for station in self.storage.stations:
+            rollups = [self.storage.get_rollup_array(station, self.field, '1h', statistic) for statistic in ('min', 'max', 'count')]
+            if all(rollup is not None for rollup in rollups):
+                stations.append((self.storage.get_array(station, self.field), rollups))
+        if len(stations) == 0:
+            return None
+
+        # the count is written last, the rollups are complete up to its length
+        hours = max(len(rollups[2]) for _, rollups in stations)
+        lower = np.full(hours, np.nan, dtype=np.float32)
+        upper = np.full(hours, np.nan, dtype=np.float32)
+        complete = np.zeros(hours, dtype=bool)
+        valid_until = hours
+        for array, (minimums, maximums, counts) in stations:
+            length = len(counts)
+            lower[:length] = np.fmin(lower[:length], minimums[:length])
+            upper[:length] = np.fmax(upper[:length], maximums[:length])
+            complete[:length] |= counts[:length] >= slots
+
+            # values stored after the last update of the rollups are not covered
+            if array is not None and len(array) > length * slots:
+                valid_until = min(valid_until, max(length - 1, 0))
+
+        complete[valid_until:] = False
+        lower[~complete] = np.nan
+        upper[~complete] = np.nan
+        return lower, upper
+
+    def get_hour_bounds(self, ends, current):
+        """ (object, object, object) -> object
+        This function returns a coarse lower bound of the score of every window ending at the given slots from the hourly rollups
+        (see get_hour_ranges): every slot of a window differs from its current value at least by the distance to the range of its hour.
+        All windows ending in the same hour share their bound, slots of hours without a range add nothing.
+        """
+        ranges = self.get_hour_ranges()
+        if ranges is None or len(ends) == 0:
+            return np.zeros(len(ends), dtype=np.float32)
+
+        # hours of the windows, with a margin of unknown hours on both sides for the oldest slots and the hours without rollups
+        slots = self.storage.rollups['1h']
+        first_group = ends[0] // slots
+        groups = ends[-1] // slots - first_group + 1
+        margin = self.intervals // slots + 2
+        lower = np.full(max(len(ranges[0]), first_group + groups) + 2 * margin, np.nan, dtype=np.float32)
+        upper = lower.copy()
+
+        # tolerate the rounding of the float32 means
+        lower[margin:margin + len(ranges[0])] = ranges[0] - 1e-3
+        upper[margin:margin + len(ranges[1])] = ranges[1] + 1e-3
+
+        # range of every hour and the hour after it
+        pair_lower = np.minimum(lower[:-1], lower[1:])
+        pair_upper = np.maximum(upper[:-1], upper[1:])
+
+        group_bounds = np.zeros(groups, dtype=np.float32)
+        below = np.empty(groups, dtype=np.float32)
+        above = np.empty(groups, dtype=np.float32)
+        for age in range(self.intervals):
+            if np.isnan(current[age]):
+                continue
+
+            # the slot of this age of all windows ending in an hour lies in the hour shift hours before, or in it and the hour after it
+            shift = (age + slots - 1) // slots
+            hours = slice(margin + first_group - shift, margin + first_group - shift + groups)
+            slot_lower, slot_upper = (lower[hours], upper[hours]) if age % slots == 0 else (pair_lower[hours], pair_upper[hours])
+
+            # slots of unknown hours (nan) add nothing
+            np.subtract(slot_lower, np.float32(current[age]), out=below)
+            np.subtract(np.float32(current[age]), slot_upper, out=above)
+            np.fmax(below, above, out=below)
+            np.fmax(below, 0, out=below)
+            below *= self.weights[age]
+            group_bounds += below
+
+        return group_bounds[ends // slots - first_group]
+
+    def get(self, times):
+        """ (object, object) -> object
+        This function returns the station means at the given local timestamps in the shape of times.
+        Timestamps without a value are nan.
+        """
+        values = self.get_values()
+        positions, on_grid = self.storage.get_positions(times)
+        result = np.full(positions.shape, np.nan)
+        if values is None:
+            return result
+
+        valid = on_grid & (positions >= 0) & (positions < len(values))
+        result[valid] = values[positions[valid]]
+        return result
+
+    def search(self, current_values, end_time, step = 1, k = 1, prefilter = 1024):
+        """ (object, object, object, int, int, int) -> object, object
+        This function compares every window of the whole history, every step slots, with the current values (newest first)
+        and returns the local end timestamps of at least the k best windows and their scores (see Prediction.score_candidates),
+        ordered by time. All windows not returned score worse than the k-th best one.
+        Only windows followed by horizon known slots before the current window starts are searched.
+        The windows of hours that cannot beat the best windows found first are skipped by their bound from the hourly rollups (see get_hour_bounds).
+        """
+        values = self.get_values()
+        if values is None:
+            return np.empty(0, dtype='datetime64[ns]'), np.empty(0)
+
+        # the last window has to end before the current window and its following hours
+        end_position = int(self.storage.get_positions(np.array([end_time], dtype='datetime64[ns]'))[0][0])
+        last_end = min(end_position - self.intervals - self.horizon, len(values) - 1 - self.horizon)
+
+        # skip the empty windows before the first stored value
+        self.get_features(values)
+        ends = np.arange(max(self.intervals - 1, self.first_valid), last_end + 1, step)
+        if len(ends) == 0:
+            return np.empty(0, dtype='datetime64[ns]'), np.empty(0)
+
+        current = np.asarray(current_values, dtype=np.float64)
+        count = min(max(prefilter, 8 * k), len(ends))
+
+        # skip the windows of all hours that cannot beat the best windows of the hours with the lowest coarse bounds
+        hour_bounds = self.get_hour_bounds(ends, current)
+        if count < len(ends) and hour_bounds.any():
+            selected = np.argpartition(hour_bounds, count - 1)[:count]
+            scores = self.score(values, ends[selected], current)
+            valid_scores = np.sort(scores[scores > 0])
+            if len(valid_scores) >= k:
+                ends = ends[hour_bounds <= valid_scores[k - 1] + 1e-2]
+
+        # score the windows with the lowest bounds first, more if there are not enough windows with data among them
+        bounds = self.get_bounds(values, ends, current)
+        count = min(count, len(ends))
+        while True:
+            selected = np.argpartition(bounds, count - 1)[:count] if count < len(ends) else np.arange(len(ends))
+            scores = self.score(values, ends[selected], current)
+            valid_scores = np.sort(scores[scores > 0])
+            if len(valid_scores) >= k or count == len(ends):
+                break
+            count = min(count * 4, len(ends))
+
+        # score all windows that may still be better than the k-th best window
+        if len(valid_scores) >= k and count < len(ends):
+            remaining = np.flatnonzero(bounds <= valid_scores[k - 1] + 1e-2)
+            remaining = np.setdiff1d(remaining, selected, assume_unique=True)
+            selected = np.concatenate([selected, remaining])
+            scores = np.concatenate([scores, self.score(values, ends[remaining], current)])
+
+        order = np.argsort(selected)
+        return self.get_times(ends[selected[order]]), scores[order]
+
+    def score(self, values, ends, current):
+        """ (object, object, object, object) -> object
+        This function returns the scores of the windows ending at the given slots against the current values (newest first).
+        Datapoints missing on either side do not count towards the difference.
+        """
+        # every row of windows is one window, oldest first, as a view on the memory map
+        windows = np.lib.stride_tricks.sliding_window_view(values, self.intervals)
+        current = current[::-1]
+        weights = self.weights[::-1]
+
+        scores = np.empty(len(ends))
+        for chunk_start in range(0, len(ends), self.chunk_size):
+            chunk_ends = ends[chunk_start:chunk_start + self.chunk_size]
+            differences = np.abs(windows[chunk_ends - (self.intervals - 1)] - current) * weights
+            scores[chunk_start:chunk_start + len(chunk_ends)] = np.nansum(differences, axis=1)
+        return scores
+
+    def get_times(self, positions):
+        """ (object, object) -> object
+        This function returns the local timestamps of the given grid positions.
+        """
+        return self.storage.origin + positions * self.storage.interval
@@ -0,0 +1,46 @@
+from abc import ABC, abstractmethod
+import pandas as pd
+
+
+class Backend(ABC):
+    """
+    Interface of the databases the observations are read from (see Database.read).
+    Every station is a measurement with one column per field, all dates are utc without timezone.
+    The results are dataframes indexed by utc time (with timezone), one per station by station name.
+    Stations without data are left out.
+    """
+
+    @abstractmethod
+    def get_last(self, stations, fields):
+        """ (object, list, list) -> dict
+        Returns the latest observation of every station with a value of any of the given fields (None for all fields) as a dataframe of one row.
+        """
+
+    @abstractmethod
+    def read_range(self, stations, fields, start_date, end_date = None, limit = None):
+        """ (object, list, list, object, object, int) -> dict
+        Returns the observations of the given fields of every station from start_date (inclusive) until end_date (exclusive, None for all),
+        oldest first and at most limit observations per station. Observations without any of the fields are left out.
+        """
+
+    @abstractmethod
+    def read_windows(self, stations, fields, windows, interval = '10m', limit = None, function = 'mean'):
+        """ (object, list, list, list, string, int, string) -> list
+        Returns the mean (or the 'min', 'max' or 'count', see function) of the given fields of every station per interval ('10m', '1h' or '1d')
+        within every (start, end) window (both exclusive), as one result per window. The intervals are aligned to midnight utc and indexed by their start,
+        at most limit intervals per station are returned. Intervals without data are left out.
+        """
+
+    @abstractmethod
+    def count_windows(self, station, field, windows, interval = '10m'):
+        """ (object, string, string, list, string) -> list
+        Returns the number of observations of the given field of the station per interval within every [start, end) window,
+        as one series per window indexed by the start of the intervals. Intervals without observations are left out.
+        """
+
+    @staticmethod
+    def get_interval(interval):
+        """ (string) -> object
+        Returns the given interval ('10m', '1h' or '1d') as a timedelta.
+        """
+        return pd.Timedelta(int(interval[:-1]), {'m': 'min', 'h': 'h', 'd': 'D'}[interval[-1]])
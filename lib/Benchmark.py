@@ -0,0 +1,195 @@
+from datetime import datetime
+from types import SimpleNamespace
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.request
+
+from lib.Database import Database
+from lib.FakeClient import FakeClient
+from lib.Prediction import Prediction
+from lib.SqliteBackend import SqliteBackend
+from lib.StationRegistry import StationRegistry
+from lib.Storage import Storage
+
+
+class Benchmark:
+
+    def __init__(self, scales = (1, 2, 5, 10, 20), repeat = 5, storage = True, backend = 'memory', stations = 2):
+        """ (object, tuple, int, bool, string, int) -> void
+        Constructor of Benchmark. Sets the numbers of years of synthetic data to benchmark with, the number of stations
+        and how often every function is run. If storage is set, the functions are also run with a local storage.
+        No database server is needed, the data is served in-process by a FakeClient (backend 'memory')
+        or a SqliteBackend in a temporary file (backend 'sqlite').
+        """
+        self.scales = list(scales)
+        self.repeat = repeat
+        self.storage = storage
+        self.backend = backend
+        self.stations = stations
+
+    def measure(self, function, setup = None):
+        """ (object, function, function) -> dict
+        This function runs the given function repeat times and returns the median and minimum duration (in seconds)
+        and the peak memory allocated by one more run (in bytes). The optional setup runs before every run.
+        """
+        durations = []
+        for _ in range(self.repeat):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            function()
+            durations.append(time.perf_counter() - start)
+
+        # measure the memory separately, tracing slows down the function
+        if setup is not None:
+            setup()
+        tracemalloc.start()
+        try:
+            function()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        return {'median': statistics.median(durations), 'min': min(durations), 'peak': peak}
+
+    def get_functions(self, database, years):
+        """ (object, object, int) -> list
+        This function returns the (name, function) pairs to benchmark with the given database.
+        """
+        prediction = Prediction(database)
+        functions = [
+            ('Database.get_data_year_ago', lambda: database.get_data_year_ago()),
+            ('Database.get_data_comparison', lambda: database.get_data_comparison()),
+            ('Database.get_data_comparison (1h)', lambda: database.get_data_comparison(interval = '1h')),
+            ('Database.get_rollup (1d max, all years)', lambda: database.get_rollup(['air_temperature'], datetime(2006, 1, 1), datetime.utcnow(), '1d', 'max')),
+            ('Database.get_snapshot', lambda: database.get_snapshot()),
+            ('Prediction.predict_temp', lambda: prediction.predict_temp(years = years)),
+            ('Prediction.predict_press', lambda: prediction.predict_press())
+        ]
+        if database.storage is not None:
+            functions.append(('Prediction.predict_temp (full history)', lambda: prediction.predict_temp(days = None)))
+
+        try:
+            from lib.Frontend import Frontend
+        except ImportError as err:
+            print(f'Skipping the Frontend callbacks ({err})')
+            return functions
+
+        # the callbacks without a sync running in the background
+        frontend = Frontend(None, database = database, sync = SimpleNamespace(is_syncing = False, has_internet_connection = lambda: True))
+        frontend.prediction = prediction
+        return functions + [
+            ('Frontend.update_text', lambda: frontend.update_text(0)),
+            ('Frontend.update_prediction_text', lambda: frontend.update_prediction_text(0)),
+            ('Frontend.update_tick', lambda: frontend.update_tick(0, None)),
+            ('Frontend.update_forecast', lambda: (setattr(frontend, 'forecast_time', None), frontend.update_forecast()))
+        ]
+
+    def run(self):
+        """ (object) -> list
+        This function runs all benchmarks at every scale, prints a table and returns the results.
+        """
+        results = []
+        print(f'{"years":>5}  {"storage":<7}  {"function":<40} {"median ms":>10} {"min ms":>10} {"peak MiB":>10}')
+
+        for years in self.scales:
+            with tempfile.TemporaryDirectory() as folder:
+                # synthetic observations of the past years and the current year until now
+                # the two lake stations and more synthetic ones
+                names = ['mythenquai', 'tiefenbrunnen'] + [f'station{number}' for number in range(3, self.stations + 1)]
+                stations = StationRegistry(names[:self.stations])
+                data = FakeClient.generate_data(datetime.utcnow().year - years, stations = list(stations))
+                if self.backend == 'sqlite':
+                    client = SqliteBackend(os.path.join(folder, 'meteorology.sqlite'))
+                    for station, station_data in data.items():
+                        client.write_points(station_data, station)
+                else:
+                    client = FakeClient(data)
+
+                databases = [('no', Database(client = client, stations = stations))]
+                if self.storage:
+                    database = Database(client = client, storage = Storage(os.path.join(folder, 'store'), stations = stations), stations = stations)
+                    start = time.perf_counter()
+                    database.update_storage()
+                    print(f'{years:>5}  {"yes":<7}  {"Database.update_storage (fill)":<40} {(time.perf_counter() - start) * 1000:>10.1f}')
+                    databases.append(('yes', database))
+
+                for uses_storage, database in databases:
+                    for name, function in self.get_functions(database, years):
+                        # every run loads the latest observations again instead of using the cached ones
+                        result = self.measure(function, database.invalidate_snapshot)
+                        result.update({'years': years, 'storage': uses_storage, 'function': name})
+                        results.append(result)
+                        print(f'{years:>5}  {uses_storage:<7}  {name:<40} {result["median"] * 1000:>10.1f} {result["min"] * 1000:>10.1f} {result["peak"] / 2 ** 20:>10.1f}')
+
+        return results
+
+    def run_startup(self, script = 'Main.py', url = 'http://localhost:8050/ready', timeout = 120):
+        """ (object, string, string, int) -> list
+        This function measures the cold start: the import of lib.Frontend in a new interpreter and the time from starting
+        the software (script) in a new process until it answers at url, which is when autostart.sh starts the browser.
+        Every measurement runs repeat times. The started software syncs like the kiosk does, e.g. with WETTERMONITOR_BACKEND set.
+        It prints a table and returns the results.
+        """
+        folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        print(f'{"startup":<40} {"median ms":>10} {"min ms":>10}')
+
+        # the import of the user interface without running anything
+        imports = []
+        for _ in range(self.repeat):
+            output = subprocess.run([sys.executable, '-c', 'import time; start = time.perf_counter(); import lib.Frontend; print(time.perf_counter() - start)'],
+                cwd = folder, capture_output = True, text = True, check = True).stdout
+            imports.append(float(output.split()[-1]))
+
+        # the software until its server answers
+        starts = []
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            process = subprocess.Popen([sys.executable, script], cwd = folder, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+            try:
+                while True:
+                    if process.poll() is not None:
+                        raise RuntimeError(f'{script} exited with code {process.returncode}')
+                    if time.perf_counter() - start > timeout:
+                        raise TimeoutError(f'{url} did not answer within {timeout}s')
+                    try:
+                        urllib.request.urlopen(url, timeout = 1).close()
+                        break
+                    except OSError:
+                        # the server is not up yet
+                        time.sleep(0.05)
+                starts.append(time.perf_counter() - start)
+            finally:
+                process.terminate()
+                process.wait()
+
+        results = []
+        for name, durations in [('import lib.Frontend', imports), (f'{script} until ready', starts)]:
+            result = {'function': name, 'median': statistics.median(durations), 'min': min(durations)}
+            results.append(result)
+            print(f'{name:<40} {result["median"] * 1000:>10.1f} {result["min"] * 1000:>10.1f}')
+        return results
+
+
+if __name__ == '__main__':
+    # python -m lib.Benchmark [--years 1 5 20] runs the benchmarks without a database server, --startup measures the cold start
+    parser = argparse.ArgumentParser(description = 'Benchmark the queries, predictions and callbacks with synthetic data.')
+    parser.add_argument('--years', type = int, nargs = '+', default = [1, 2, 5, 10, 20])
+    parser.add_argument('--repeat', type = int, default = 5)
+    parser.add_argument('--no-storage', action = 'store_true')
+    parser.add_argument('--backend', choices = ['memory', 'sqlite'], default = 'memory')
+    parser.add_argument('--stations', type = int, default = 2, help = 'number of stations, synthetic ones are added to the two lake stations')
+    parser.add_argument('--startup', action = 'store_true', help = 'measure the cold start of Main.py instead')
+    arguments = parser.parse_args()
+
+    benchmark = Benchmark(arguments.years, arguments.repeat, not arguments.no_storage, arguments.backend, arguments.stations)
+    if arguments.startup:
+        benchmark.run_startup()
+    else:
+        benchmark.run()
@@ -0,0 +1,115 @@
+from contextlib import contextmanager
+import threading
+import time
+
+
+class Connection:
+
+    def __init__(self, host = 'localhost', port = 8086, database = 'meteorology', max_clients = 4, client = None):
+        """ (object, string, int, string, int, object) -> void
+        Constructor of Connection. Sets the database server and the maximum number of clients.
+        Clients are created when needed and kept open for the next caller, so their http connection stays alive.
+        If a client is given, it is the only client and callers use it one after another.
+        """
+        self.host = host
+        self.port = port
+        self.database = database
+        self.max_clients = 1 if client is not None else max_clients
+
+        # the given client (e.g. an embedded backend), shared with the sync of the weatherstation library
+        self.shared_client = client
+
+        # idle clients ready to be used and number of clients created so far
+        self.idle_clients = [] if client is None else [client]
+        self.created_clients = 0 if client is None else 1
+        self.is_initialized = False
+
+        # guards the idle clients and the statistics, signals returned clients
+        self.condition = threading.Condition()
+
+        # statistics about the usage of the clients
+        self.queries = 0
+        self.errors = 0
+        self.query_time = 0.0
+        self.wait_time = 0.0
+
+    def create_client(self):
+        """ (object) -> object
+        This function creates a new client connected to the database.
+        """
+        # only needed without an injected client
+        from influxdb import DataFrameClient
+
+        return DataFrameClient(host = self.host, port = self.port, database = self.database)
+
+    def initialize(self, client):
+        """ (object, object) -> void
+        This function creates (if not exist) and switches to the database. It only runs once.
+        """
+        with self.condition:
+            if self.is_initialized:
+                return
+            client.create_database(self.database)
+            self.is_initialized = True
+
+    @contextmanager
+    def client(self):
+        """ (object) -> object
+        Context manager returning a client for the exclusive use of the calling thread.
+        It waits until a client is available if all clients are in use.
+        """
+        wait_start = time.perf_counter()
+        with self.condition:
+            # wait until a client is idle or a new one may be created
+            while len(self.idle_clients) == 0 and self.created_clients >= self.max_clients:
+                self.condition.wait()
+
+            if len(self.idle_clients) > 0:
+                client = self.idle_clients.pop()
+            else:
+                client = None
+                self.created_clients += 1
+
+        try:
+            if client is None:
+                client = self.create_client()
+        except Exception:
+            # free the slot of the client that could not be created
+            with self.condition:
+                self.created_clients -= 1
+                self.condition.notify()
+            raise
+
+        query_start = time.perf_counter()
+        failed = False
+        try:
+            self.initialize(client)
+            client.switch_database(self.database)
+            yield client
+        except Exception:
+            failed = True
+            raise
+        finally:
+            query_end = time.perf_counter()
+            with self.condition:
+                # hand the client to the next caller
+                self.idle_clients.append(client)
+                self.queries += 1
+                self.errors += failed
+                self.wait_time += query_start - wait_start
+                self.query_time += query_end - query_start
+                self.condition.notify()
+
+    def get_stats(self):
+        """ (object) -> dict
+        This function returns the number of queries and errors, the total time spent in queries and
+        waiting for a client (in seconds) and the number of open clients.
+        """
+        with self.condition:
+            return {
+                'queries': self.queries,
+                'errors': self.errors,
+                'query_time': self.query_time,
+                'wait_time': self.wait_time,
+                'clients': self.created_clients
+            }
@@ -0,0 +1,80 @@
+import threading
+import socket
+import time
+
+
+class Connectivity:
+
+    def __init__(self, host = '1.1.1.1', port = 80, timeout = 2, interval = 30, max_interval = 300):
+        """ (object, string, int, int, int, int) -> void
+        Constructor of Connectivity. Sets the host to probe, the probe timeout and how often to probe (in seconds).
+        After a failed probe the interval doubles up to max_interval, until a probe succeeds again.
+        """
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.interval = interval
+        self.max_interval = max_interval
+
+        # the connection is assumed to work until a probe tells otherwise
+        self.is_online = True
+        self.last_update = None
+        self.current_interval = interval
+
+        self.wake = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """ (object) -> void
+        This function starts monitoring the connection in a seperate thread.
+        """
+        if self.thread is None:
+            self.thread = threading.Thread(target = self.run_periodic, daemon = True)
+            self.thread.start()
+
+    def run_periodic(self):
+        """ (object) -> void
+        This function probes the connection until the software is shut down.
+        Probes are skipped while other requests recently reported the state of the connection.
+        """
+        while True:
+            if self.last_update is None or time.monotonic() - self.last_update >= self.current_interval:
+                self.report(self.probe())
+
+            # wait for the next probe or until the monitor is woken up
+            self.wake.wait(self.current_interval)
+            self.wake.clear()
+
+    def probe(self):
+        """ (object) -> bool
+        This function returns true if the host is reachable.
+        """
+        try:
+            # connect to the host -- tells us if the host is actually reachable
+            socket_connection = socket.create_connection((self.host, self.port), self.timeout)
+            socket_connection.close()
+            return True
+        except OSError:
+            pass
+        return False
+
+    def report(self, is_online):
+        """ (object, bool) -> void
+        This function updates the state of the connection.
+        It is called with the result of every probe and of every other request to the internet.
+        """
+        was_online = self.is_online
+        self.is_online = is_online
+        self.last_update = time.monotonic()
+
+        # probe less often while offline, back to normal once online
+        if is_online:
+            self.current_interval = self.interval
+        else:
+            self.current_interval = min(self.current_interval * 2, self.max_interval) if not was_online else self.interval
+
+    def is_connected(self):
+        """ (object) -> bool
+        This function returns the last known state of the connection without waiting.
+        """
+        return self.is_online
@@ -1,77 +1,246 @@
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from influxdb import DataFrameClient
 import pandas as pd
 import numpy as np
+import threading
+import time
+import warnings
+
+from lib.AnalogIndex import AnalogIndex
+from lib.Backend import Backend
+from lib.Connection import Connection
+from lib.InfluxBackend import InfluxBackend
+from lib.MemoryBudget import MemoryBudget
+from lib.Metrics import Metrics
+from lib.Profiler import Profiler
+from lib.StationRegistry import StationRegistry
 
 
 class Database:
 
-    def __init__(self, client = DataFrameClient(host = 'localhost', port = 8086)):
-        """ (object, object) -> void
-        Constructor of Database. Sets the database client.
+    def __init__(self, client = None, storage = None, snapshot_ttl = 60, max_clients = 4, metrics = None, profiler = None, memory = None, stations = None):
+        """ (object, object, object, int, int, object, object, object, object) -> void
+        Constructor of Database. Sets the optional database client and the optional local storage of historic data.
+        The observations are read through a backend (see Backend): the given client if it is one (e.g. SqliteBackend),
+        otherwise the influxdb server (see InfluxBackend) through the given client or up to max_clients clients opened as needed.
+        The queried stations are taken from the station registry (see StationRegistry), every station is queried on its own.
+        The latest observations are cached for snapshot_ttl seconds or until new data is written.
+        The metrics record the queries and are shared with the classes using this database, same as the profiler
+        and the memory budget of the caches (see MemoryBudget).
         """
-        self.client = client
-
-
-    def query(self, query_string):
-        """ (object, string) -> object
-        This function queries the given query string.
-        It also creates (if not exist) and switches to the database meteorology.
-        It returns the result as a dataframe.
+        self.connection = Connection(max_clients = max_clients, client = client)
+        self.backend = client if isinstance(client, Backend) else InfluxBackend(self.connection)
+        self.storage = storage
+        self.stations = StationRegistry() if stations is None else stations
+
+        # station mean temperatures of the local storage to search analogs in
+        self.analog_index = None if storage is None else AnalogIndex(storage)
+        self.metrics = Metrics() if metrics is None else metrics
+        self.profiler = Profiler() if profiler is None else profiler
+        self.memory = MemoryBudget(metrics = self.metrics) if memory is None else memory
+
+        # fields of the latest observations
+        self.last_fields = ['air_temperature', 'water_temperature', 'wind_speed_avg_10min', 'wind_force_avg_10min', 'wind_direction']
+
+        # show the reads in the timing breakdown of profiled calls
+        self.read = self.profiler.stage('Database.read', self.read)
+        self.get_data_comparison = self.profiler.stage('Database.get_data_comparison', self.get_data_comparison)
+        self.update_storage = self.profiler.stage('Database.update_storage', self.update_storage)
+
+        # cached latest observations shared by all callers
+        self.snapshot = None
+        self.snapshot_loaded = 0
+        self.snapshot_ttl = snapshot_ttl
+        self.snapshot_lock = threading.Lock()
+
+        # utc (start, end) ranges of every station to read into the local storage again, see update_storage
+        self.gaps = {}
+
+        # caches that are dropped when the memory budget is exceeded, they are filled again when needed
+        self.memory.register('snapshot', self.get_snapshot_size, self.invalidate_snapshot)
+        if storage is not None:
+            self.memory.register('storage', storage.get_cache_size, storage.clear_cache)
+            self.memory.register('analog_index', self.analog_index.get_cache_size, self.analog_index.clear_cache)
+
+
+    def read(self, function, *arguments):
+        """ (object, function, ...) -> object
+        This function reads observations with the given function of the backend (see Backend) and the given arguments.
+        It returns the result of the function or None if the read failed.
         """
-        self.client.create_database('meteorology')
-        self.client.switch_database('meteorology')
+        start = time.perf_counter()
         try:
-            # execute query
-            return self.client.query(query_string)
+            result = function(*arguments)
+            self.metrics.increment('wettermonitor_query_rows_total', self.count_rows(result))
+            return result
         except Exception as err:
             print (err)
-        # return data frame result
-        return pd.DataFrame()
-
-    def query_all(self, query_string):
-        """ (object, string) -> object
-        This function queries the given query string through the query function.
-        It combines the results into one single dataframe.
-        The return value is the combined dataframe.
+            self.metrics.increment('wettermonitor_query_errors_total')
+        finally:
+            self.metrics.observe('wettermonitor_query_seconds', time.perf_counter() - start)
+        return None
+
+    def read_stations(self, function, *arguments):
+        """ (object, function, ...) -> object
+        This function reads the observations of every station with the given function of the backend (see Backend),
+        called with the station and the given arguments, all stations at the same time.
+        The results of all stations are merged, so it returns the same as a single read of all stations.
+        Stations whose read failed are left out, it returns None if the reads of all stations failed.
         """
-        result = self.query(query_string)
-        all_data = None
+        results = self.stations.map(lambda station: self.read(function, [station], *arguments))
+        results = [result for result in results.values() if result is not None]
+        if len(results) == 0:
+            return None
+
+        # functions reading multiple windows return one result per window
+        if isinstance(results[0], dict):
+            return {station: data for result in results for station, data in result.items()}
+        merged = [{} for _ in results[0]]
+        for result in results:
+            for window_result, station_result in zip(merged, result):
+                window_result.update(station_result)
+        return merged
+
+    def count_rows(self, result):
+        """ (object, object) -> int
+        This function returns the number of rows of all stations of a read result.
+        """
+        if not self.metrics.enabled:
+            return 0
+        results = result if isinstance(result, list) else [result]
+        return sum(len(window_result) if isinstance(window_result, pd.Series) else sum(len(window_result[station]) for station in window_result) for window_result in results)
+
+    def get_stats(self):
+        """ (object) -> dict
+        This function returns the query statistics of the database connection.
+        """
+        return self.connection.get_stats()
 
-        # combine all stations into single dataframe
+    def get_station_frames(self, result):
+        """ (object, object) -> dict
+        This function converts a read result into a dictionary of float32 dataframes per station.
+        Each dataframe is indexed by local time.
+        """
+        frames = {}
         for measurement in result:
-            data = result[measurement]
-            data['station'] = measurement
+            data = result[measurement].astype(np.float32)
             data.index = data.index.tz_convert('Europe/Berlin')
             data.index = data.index.tz_localize(None)
-            if all_data is None:
-                all_data = data
-            else:
-                all_data = all_data.append(data, sort=False)
-
-        # return combined dataframe
-        return all_data
 
-    def query_combine(self, query_string):
-        """ (object, string) -> object
-        This function queries the given query string through the query function.
-        It combines the results into one single dataframe.
-        The return value is the combined dataframe.
+            # the hour repeated when daylight saving time ends is merged into one timestamp
+            if data.index.has_duplicates:
+                data = data.groupby(level=0).mean()
+            frames[measurement] = data
+        return frames
+
+    def combine_stations(self, results, mean = False):
+        """ (object, list, bool) -> object
+        This function combines a list of station dictionaries (see get_station_frames) into one dataframe
+        with one column per field and station. If mean is set, the mean of all stations is added as station 'mean'.
+        It returns None if there is no data.
+        """
+        # collect the dataframes of every station
+        stations = {}
+        for result in results:
+            for station in result:
+                stations.setdefault(station, []).append(result[station])
+
+        if len(stations) == 0:
+            return None
+
+        # put all stations next to each other, aligned by timestamp
+        stations = {station: frames[0] if len(frames) == 1 else pd.concat(frames) for station, frames in stations.items()}
+        data = pd.concat(stations, axis=1, sort=True)
+        data = data.swaplevel(axis=1)
+
+        if mean:
+            # add the mean of all stations of every field
+            means = self.reduce_stations(stations).reindex(data.index)
+            means.columns = pd.MultiIndex.from_product([means.columns, ['mean']])
+            data = pd.concat([data, means], axis=1)
+
+        return data.sort_index(axis=1)
+
+    def reduce_stations(self, frames, function = 'mean'):
+        """ (object, dict, string) -> object
+        This function aggregates the dataframes of all stations (see get_station_frames) into one float32 dataframe
+        with the mean, min or max (function) of all stations per timestamp and field, ignoring missing values.
+        Numbers of values ('count') are added up.
+        All stations are aligned in one (stations x timestamps x fields) array and aggregated at once.
+        It returns None if there is no data.
+        """
+        frames = [data for data in frames.values() if not data.empty]
+        if len(frames) == 0:
+            return None
+
+        # all timestamps and fields of all stations
+        times = np.unique(np.concatenate([data.index.to_numpy() for data in frames]))
+        fields = list(dict.fromkeys(field for data in frames for field in data.columns))
+
+        stacked = np.full((len(frames), len(times), len(fields)), np.nan, dtype=np.float32)
+        for row, data in enumerate(frames):
+            positions = np.searchsorted(times, data.index.to_numpy())
+            columns = [fields.index(field) for field in data.columns]
+            stacked[row][np.ix_(positions, columns)] = data.to_numpy(dtype=np.float32)
+
+        with warnings.catch_warnings():
+            # timestamps and fields without any station stay nan
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            values = {'mean': np.nanmean, 'min': np.nanmin, 'max': np.nanmax, 'count': np.nansum}[function](stacked, axis=0)
+
+        return pd.DataFrame(values, index=pd.DatetimeIndex(times), columns=fields)
+
+    def get_mean_frames(self, result, function = 'mean'):
+        """ (object, object, string) -> dict
+        This function converts the result of a read of means (see Backend.read_windows, one aggregated dataframe per station)
+        into a dictionary with the single station 'mean', aggregating all stations with function (see reduce_stations).
+        """
+        data = self.reduce_stations(self.get_station_frames(result), function)
+        return {} if data is None else {'mean': data}
+
+    def get_rollup(self, fields, start_date, end_date, interval = '1h', statistic = 'mean'):
+        """ (object, list, object, object, string, string) -> object
+        This function returns the min, mean, max or number of values (statistic) of all stations of the given fields
+        per interval ('1h' or '1d') between the utc dates start_date and end_date, with one column per field, e.g. for views of many years.
+        The rollups maintained by the local storage are read if it holds data, otherwise they are calculated by the database.
+        It returns None if there is no data.
+        """
+        if self.has_storage() and interval in self.storage.rollups and all(field in self.storage.fields for field in fields):
+            self.memory.touch('storage')
+            frames = {}
+            for station in self.storage.stations:
+                columns = {}
+                for field in fields:
+                    index, columns[field] = self.storage.read_rollup(station, field, interval, statistic, self.to_local_time(start_date), self.to_local_time(end_date))
+                data = pd.DataFrame(columns, index=index, copy=False)
+
+                # drop empty buckets, like the database does not return them
+                data = data[(data > 0).any(axis=1)] if statistic == 'count' else data.dropna(how='all')
+                if not data.empty:
+                    frames[station] = data
+
+            # aggregate all stations the same way as the buckets
+            return self.reduce_stations(frames, statistic)
+
+        result = self.read_stations(self.backend.read_windows, fields, [(start_date, end_date)], interval, None, statistic)
+        return None if result is None else self.get_mean_frames(result[0], statistic).get('mean')
+
+    def combine_latest(self, result):
+        """ (object, object) -> object
+        This function combines the latest observation of all stations in the given wide dataframe into their mean.
         """
-        # query all stations
-        result = self.query_all(query_string)
         if result is None:
             return pd.DataFrame()
 
         # only get latest (filter out stations without new data)
-        latest = result[result.index == result.index.max()]
+        latest = result.loc[result.index.max()].astype(np.float64)
 
         if 'wind_direction' in latest:
-            wind_direction = latest['wind_direction']
+            wind_direction = latest['wind_direction'].dropna()
 
             # calculate mean wind direction based on formula from: https://en.wikipedia.org/wiki/Mean_of_circular_quantities#Mean_of_angles
-            mean_wind = np.round(np.arctan2(sum(np.sin(wind_direction)), sum(np.cos(wind_direction))) * 180 / np.pi) % 360
+            mean_wind = np.round(np.arctan2(np.sin(wind_direction).sum(), np.cos(wind_direction).sum()) * 180 / np.pi) % 360
 
             # convert direction to string
             if 292.5 < mean_wind <= 337.5:
@@ -91,10 +260,11 @@ class Database:
             else:
                 mean_wind = 'N'
 
-        # get mean of all values
-        latest = latest.mean(skipna=True).round(1)
+        # get mean of all stations of every field
+        latest = latest.groupby(level=0).mean().round(1)
 
         if 'wind_direction' in latest:
+            latest = latest.astype(object)
             latest['wind_direction'] = mean_wind
 
         return latest
@@ -103,33 +273,82 @@ class Database:
         """ (object) -> object
         This function returns the latest available observation.
         """
-        return self.query_combine('''
-                                SELECT
-                                air_temperature,
-                                water_temperature,
-                                wind_speed_avg_10min,
-                                wind_force_avg_10min,
-                                wind_direction
-                                FROM /^(tiefenbrunnen|mythenquai)/
-                                ORDER BY DESC LIMIT 1
-                            ''')
+        return self.get_snapshot()['last_data']
+
+    def get_snapshot(self):
+        """ (object) -> dict
+        This function returns the cached latest observation ('last_data'), the station means of the last five hours ('last_five_hours')
+        and the timestamp of the newest observation ('time').
+        Both are read for all stations at the same time whenever the cache is older than snapshot_ttl or has been invalidated.
+        Concurrent callers wait for the same request instead of sending their own.
+        The returned dataframes are shared and must not be modified.
+        """
+        self.memory.touch('snapshot')
+        with self.snapshot_lock:
+            is_expired = self.snapshot is None or time.monotonic() - self.snapshot_loaded > self.snapshot_ttl
+            self.metrics.increment('wettermonitor_cache_requests_total', cache = 'snapshot', result = 'miss' if is_expired else 'hit')
+
+            if is_expired:
+                # get date now and now - 5 hours
+                date_now = datetime.utcnow()
+                start_date = date_now - timedelta(hours=5)
+
+                last_data = self.read_stations(self.backend.get_last, self.last_fields)
+                last_five_hours = self.read_stations(self.backend.read_windows, ['air_temperature', 'barometric_pressure_qfe'], [(start_date, date_now)])
+
+                if last_data is not None and last_five_hours is not None:
+                    last_data = self.combine_stations([self.get_station_frames(last_data)])
+                    self.snapshot = {
+                        'time': None if last_data is None else last_data.index.max(),
+                        'last_data': self.combine_latest(last_data),
+                        'last_five_hours': self.combine_stations([self.get_mean_frames(last_five_hours[0])])
+                    }
+                    self.snapshot_loaded = time.monotonic()
+                else:
+                    # do not cache failed requests
+                    return {'time': None, 'last_data': pd.DataFrame(), 'last_five_hours': None}
+
+            return self.snapshot
+
+    def invalidate_snapshot(self):
+        """ (object) -> void
+        This function drops the cached latest observations, the next caller loads them again.
+        It is called whenever new data has been written to the database.
+        """
+        with self.snapshot_lock:
+            self.snapshot = None
+
+    def get_snapshot_size(self):
+        """ (object) -> int
+        This function returns the size in bytes of the cached latest observations.
+        """
+        snapshot = self.snapshot
+        if snapshot is None:
+            return 0
+        return int(sum(np.sum(value.memory_usage(deep=True)) for value in snapshot.values() if isinstance(value, (pd.DataFrame, pd.Series))))
 
     def get_data_specific_date(self, date):
         """ (object, object) -> object
-        This function returns a dataframe containing the closest 30 obervations after 'date'.
-        """
-        # convert date to string in the specified date format
-        date_string = date.strftime('%Y-%m-%d %H:%M:%S')
-
-        # run query
-        result = self.query_all(f'''
-                                SELECT
-                                air_temperature
-                                FROM /^(tiefenbrunnen|mythenquai)/
-                                WHERE time > '{date_string}'
-                                ORDER BY ASC LIMIT 30
-                        ''')
-        return result
+        This function returns a dataframe containing the station mean of the closest 30 obervations after 'date'.
+        """
+        return self.get_data_specific_dates([date])[0]
+
+    def get_data_specific_dates(self, dates):
+        """ (object, list) -> list
+        This function returns the station mean of the closest 30 observations after every date (see get_data_specific_date).
+        All dates are read at once per station. Dates without data return None.
+        """
+        if len(dates) == 0:
+            return []
+
+        # one window per date, the next day holds more than enough observations
+        result = self.read_stations(self.backend.read_windows, ['air_temperature'], [(date, date + timedelta(days=1)) for date in dates], '10m', 30)
+        if result is None:
+            return [None] * len(dates)
+
+        # the stations may have different first observations, keep the first 30 of all stations
+        means = [self.combine_stations([self.get_mean_frames(date_result)]) for date_result in result]
+        return [None if data is None else data.iloc[:30] for data in means]
 
     # gets data from exactly one year ago
     def get_data_year_ago(self):
@@ -142,87 +361,237 @@ class Database:
         # get date now - 1 year in utc
         date_year_ago = date_year_ago.replace(year=date_year_ago.year - 1)
 
-        # convert date to string in the specified date format
-        date_year_ago_string = date_year_ago.strftime('%Y-%m-%d %H:%M:%S')
-
-        # run query
-        result = self.query_all(f'''
-                                SELECT
-                                air_temperature,
-                                water_temperature,
-                                wind_speed_avg_10min,
-                                wind_force_avg_10min,
-                                wind_direction
-                                FROM /^(tiefenbrunnen|mythenquai)/
-                                WHERE time > '{date_year_ago_string}'
-                                ORDER BY ASC LIMIT 20
-                        ''')
-        return result
+        # read the first 20 observations after the date
+        result = self.read_stations(self.backend.read_range, self.last_fields, date_year_ago, None, 20)
+        return self.combine_stations([self.get_station_frames(result or {})])
 
     def get_last_five_hours(self):
         """ (object) -> object
         This function returns all data between now and now - 5 hours.
         """
-        # get date now
-        date_now = datetime.utcnow()
+        return self.get_snapshot()['last_five_hours']
+
+    def get_data_comparison(self, parallel = False, max_workers = 4, interval = '10m'):
+        """ (object, bool, int, string) -> object
+        This function returns the station mean of all observations around +/- 7 days from every year except
+        the current year, per interval: every observation ('10m') or the hourly or daily means ('1h' or '1d').
+        The observations are read from the local storage if it holds any data, the hourly and daily means from its rollups.
+        Otherwise all years are read at once per station. If parallel is set, every year is read
+        on its own, with at most max_workers years running at the same time.
+        In low memory mode (see MemoryBudget), the years are fetched one after another and only their float32 means are kept.
+        """
+        windows = self.get_comparison_windows()
+
+        if self.has_storage():
+            # read all windows from the local storage
+            result = self.get_storage_data(windows, ['air_temperature'], interval)
+        else:
+            # let the database calculate the station means of every year
+            def read_year(window):
+                result = self.read_stations(self.backend.read_windows, ['air_temperature'], [window], interval)
+                return {} if result is None else result[0]
+
+            if self.memory.enabled:
+                # the result of every year is reduced before the next one is read
+                result = self.combine_stations([self.get_mean_frames(read_year(window)) for window in windows])
+            elif parallel:
+                # read every year in a bounded thread pool
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    results = list(executor.map(read_year, windows))
+                result = self.combine_stations([self.get_mean_frames(year_result) for year_result in results])
+            else:
+                # read all years of a station at once
+                results = self.read_stations(self.backend.read_windows, ['air_temperature'], windows, interval)
+                result = self.combine_stations([self.get_mean_frames(year_result) for year_result in (results or [])])
 
-        # get date now - 5 hours
-        start_date = date_now - timedelta(hours=5)
-
-        # convert dates to string in the specified date format
-        start_date_string = start_date.strftime('%Y-%m-%d %H:%M:%S')
-        end_date_string = date_now.strftime('%Y-%m-%d %H:%M:%S')
-
-        # run query
-        result = self.query_all(f'''
-                            SELECT
-                            air_temperature,
-                            barometric_pressure_qfe
-                            FROM /^(tiefenbrunnen|mythenquai)/
-                            WHERE time > '{start_date_string}' AND time < '{end_date_string}'
-                            ORDER BY ASC
-                    ''')
         return result
 
-    def get_data_comparison(self):
-        """ (object) -> object
-        This function returns all observations around +/- 7 days from every year except the current year.
+    def get_comparison_windows(self):
+        """ (object) -> list
+        This function returns the (start, end) dates of +/- 7 days around now in every year except the current year.
         """
         # get date now
         date_now = datetime.utcnow()
-        result = None
+        windows = []
 
         # iterate through all years
         for x in range(1, date_now.year - 2006):
             date_x_years_ago = date_now.replace(year=date_now.year-x)
 
             # get dates +/- 7 days
-            start_date = date_x_years_ago - timedelta(days=7)
-            end_date = date_x_years_ago + timedelta(days=7)
-
-            # convert dates to string of given format
-            start_date_string = start_date.strftime('%Y-%m-%d %H:%M:%S')
-            end_date_string = end_date.strftime('%Y-%m-%d %H:%M:%S')
-
-            # run query
-            data = self.query_all(f'''
-                                SELECT
-                                air_temperature
-                                FROM /^(tiefenbrunnen|mythenquai)/
-                                WHERE time > '{start_date_string}' AND time < '{end_date_string}'
-                                ORDER BY ASC
-                        ''')
-
-            if result is None:
-                result = data
-            else:
-                result = result.append(data, sort=False)
+            windows.append((date_x_years_ago - timedelta(days=7), date_x_years_ago + timedelta(days=7)))
 
-        if not result is None:
-            result.sort_index(inplace=True)
+        return windows
 
-        return result
+    def get_comparison_mask(self, times):
+        """ (object, object) -> object
+        This function returns true for every local timestamp that lies within the comparison windows.
+        """
+        times = np.asarray(times, dtype='datetime64[ns]')
+        mask = np.zeros(times.shape, dtype=bool)
+        for start_date, end_date in self.get_comparison_windows():
+            mask |= (times > np.datetime64(self.to_local_time(start_date), 'ns')) & (times < np.datetime64(self.to_local_time(end_date), 'ns'))
+        return mask
+
+    def to_local_time(self, date):
+        """ (object, object) -> object
+        This function converts a utc date to local time (Europe/Berlin) without timezone, like the read results.
+        """
+        return pd.Timestamp(date).tz_localize('UTC').tz_convert('Europe/Berlin').tz_localize(None).to_pydatetime()
 
+    def has_storage(self):
+        """ (object) -> bool
+        This function returns true if a local storage is set and holds data.
+        """
+        return self.storage is not None and self.storage.get_last_time() is not None
+
+    def get_storage_data(self, windows, fields, interval = '10m'):
+        """ (object, list, list, string) -> object
+        This function reads the given fields of all stations within all utc (start, end) windows from the local storage,
+        every observation ('10m') or the hourly or daily means of the rollups ('1h' or '1d').
+        The result has the same layout as combine_stations with station means.
+        """
+        self.memory.touch('storage')
+        results = []
+        for start_date, end_date in windows:
+            frames = {}
+            for station in self.storage.stations:
+                columns = {}
+                for field in fields:
+                    if interval == '10m':
+                        index, columns[field] = self.storage.read(station, field, self.to_local_time(start_date), self.to_local_time(end_date))
+                    else:
+                        index, columns[field] = self.storage.read_rollup(station, field, interval, 'mean', self.to_local_time(start_date), self.to_local_time(end_date))
+                data = pd.DataFrame(columns, index=index, copy=False)
+
+                # drop empty grid slots, like the database does not return them
+                data = data.dropna(how='all')
+                if not data.empty:
+                    frames[station] = data
+            results.append(frames)
+
+        return self.combine_stations(results, mean=True)
+
+    def update_storage(self, gaps = None):
+        """ (object, dict) -> dict
+        This function appends all observations missing in the local storage from the database and updates the rollups and the analog index.
+        It reads the database year by year, or month by month in low memory mode, to keep the memory usage low.
+        Every station is read on its own from its last stored observation, all stations at the same time.
+        The utc (start, end) ranges given as gaps of every station (see Sync.find_gaps) are read again, e.g. after they have been backfilled.
+        Gaps that could not be read yet are kept and read again by the next update.
+        It returns the first changed 10 minute slot of every changed station (see Storage.update_rollups).
+        Raises an exception at the first failed read, so the next update continues at the last stored observation.
+        """
+        if self.storage is None:
+            return {}
+
+        # the given gaps and those left over by a failed update
+        for station, ranges in (gaps or {}).items():
+            self.gaps.setdefault(station, []).extend(ranges)
+
+        date_now = datetime.utcnow()
+        chunk = timedelta(days=30 if self.memory.enabled else 365)
+        appended_from = self.stations.map(lambda station: self.append_storage(station, date_now, chunk))
+
+        # read the given ranges before the last stored observation again, at most a chunk at once
+        for station in list(self.gaps):
+            ranges = self.gaps[station]
+            while len(ranges) > 0:
+                range_start, range_end = ranges[0]
+                range_end = min(range_end, appended_from.get(station, date_now))
+                while range_start < range_end:
+                    self.write_storage(station, range_start, min(range_start + chunk, range_end))
+                    range_start += chunk
+                    ranges[0] = (range_start, ranges[0][1])
+                ranges.pop(0)
+            del self.gaps[station]
+
+        # update the hourly and daily rollups and the analog index with the new observations
+        changed = self.storage.update_rollups()
+        self.analog_index.update(changed)
+
+        # the storage has opened all its files
+        self.memory.enforce()
+        return changed
+
+    def append_storage(self, station, end_date, chunk):
+        """ (object, string, object, object) -> object
+        This function appends the observations of the given station missing in the local storage until end_date (utc),
+        a chunk of time at once. Every station continues at its own last stored observation.
+        It returns the utc time the station was appended from.
+        """
+        # continue at the last stored observation, overlap a few hours to cover the timezone offset
+        start_date = self.storage.get_last_time(station)
+        start_date = pd.Timestamp(self.storage.origin).to_pydatetime() if start_date is None else start_date - timedelta(hours=3)
+        appended_from = start_date
+
+        while start_date < end_date:
+            self.write_storage(station, start_date, start_date + chunk)
+            start_date += chunk
+        return appended_from
+
+    def write_storage(self, station, start_date, end_date):
+        """ (object, string, object, object) -> void
+        This function writes the observations of the given station from start_date until end_date (utc) into the local storage.
+        Raises an exception if the database could not be read.
+        """
+        result = self.read(self.backend.read_range, [station], self.storage.fields, start_date, end_date)
+        if result is None:
+            raise RuntimeError(f'Could not read {station} from {start_date} until {end_date}')
+
+        frames = self.get_station_frames(result)
+        if station in frames:
+            self.storage.write(station, frames[station])
+
+    def get_gaps(self, station, end_date = None):
+        """ (object, string, object) -> list
+        This function returns the utc (start, end) ranges of all missing 10 minute observations of the given station
+        between its first observation and end_date (default now). The end of every range is exclusive.
+        It returns None if there is no observation of the station at all.
+        """
+        end_date = datetime.utcnow() if end_date is None else end_date
+
+        # count the observations of every day, a complete day has 144 observations
+        result = self.read(self.backend.count_windows, station, 'air_temperature', [(datetime(2006, 1, 1), end_date)], '1d')
+        if result is None:
+            # the read failed, do not report anything as missing
+            return []
+        if result[0].empty:
+            return None
+
+        counts = result[0]
+        counts.index = counts.index.tz_convert(None)
+        days = pd.date_range(counts.index.min(), end_date, freq='D')
+        counts = counts.reindex(days, fill_value=0)
+
+        # group the incomplete days into runs of consecutive days
+        incomplete_days = counts.index[counts.to_numpy() < 144]
+        if len(incomplete_days) == 0:
+            return []
+        day_values = incomplete_days.to_numpy(dtype='datetime64[ns]')
+        run_starts = np.flatnonzero(np.diff(day_values, prepend=day_values[:1] - np.timedelta64(2, 'D')) > np.timedelta64(1, 'D'))
+        runs = [(incomplete_days[start], min(incomplete_days[end - 1] + timedelta(days=1), pd.Timestamp(end_date))) for start, end in zip(run_starts, list(run_starts[1:]) + [len(incomplete_days)])]
+
+        # count the observations of every 10 minutes of all runs at once
+        result = self.read(self.backend.count_windows, station, 'air_temperature', runs, '10m')
+        if result is None:
+            return []
+
+        gaps = []
+        for (run_start, run_end), run_counts in zip(runs, result):
+            # the 10 minutes without observations, the whole run if there are none
+            slots = pd.date_range(run_start, run_end, freq='10min', inclusive='left')
+            run_counts = run_counts.set_axis(run_counts.index.tz_convert(None)).reindex(slots, fill_value=0)
+            slots = slots[run_counts.to_numpy() == 0]
+            if len(slots) == 0:
+                continue
+
+            # merge consecutive missing slots into ranges
+            breaks = np.flatnonzero(np.diff(slots.to_numpy()) > np.timedelta64(10, 'm'))
+            for first, last in zip([0] + list(breaks + 1), list(breaks) + [len(slots) - 1]):
+                gaps.append((slots[first].to_pydatetime(), min(slots[last] + timedelta(minutes=10), run_end).to_pydatetime()))
+
+        return gaps
 
     def get_time_rounded(self, time):
         """ (object, object) -> object
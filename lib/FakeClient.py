@@ -0,0 +1,208 @@
+from datetime import datetime
+import re
+import numpy as np
+import pandas as pd
+
+
+class FakeClient:
+
+    def __init__(self, measurements = None):
+        """ (object, dict) -> void
+        Constructor of FakeClient. An in-process stand-in for influxdb's DataFrameClient holding all data in memory,
+        for benchmarks without a database server. It can be injected with Database(client = FakeClient(...)).
+        It answers the queries of InfluxBackend and the weatherstation library, the aggregations are calculated from the rows read.
+        measurements maps every station to a dataframe indexed by utc time.
+        """
+        self.measurements = {}
+        for measurement, data in (measurements or {}).items():
+            self.write_points(data, measurement)
+
+    @staticmethod
+    def generate_data(start_year = 2006, end_date = None, seed = 0, stations = ('mythenquai', 'tiefenbrunnen')):
+        """ (int, object, int, tuple) -> dict
+        Generates synthetic observations of the given stations every 10 minutes from start_year until end_date (default now).
+        The fields follow the messwerte_<station>_<year>.csv files, the index is utc time.
+        """
+        end_date = datetime.utcnow() if end_date is None else end_date
+        index = pd.date_range(datetime(start_year, 1, 1), end_date, freq='10min', tz='UTC')
+        random = np.random.default_rng(seed)
+
+        # seasonal and daily cycle of the temperatures
+        day_of_year = index.dayofyear.to_numpy() / 365.25
+        hour_of_day = (index.hour.to_numpy() + index.minute.to_numpy() / 60) / 24
+        season = -np.cos(2 * np.pi * day_of_year)
+        daily = -np.cos(2 * np.pi * (hour_of_day - 0.1))
+
+        data = {}
+        for station in stations:
+            count = len(index)
+            # slowly changing weather on top of the cycles
+            weather = np.cumsum(random.normal(0, 0.05, count))
+            weather -= pd.Series(weather).rolling(1008, min_periods=1).mean().to_numpy()
+            air_temperature = 10 + 9 * season + 4 * daily + weather + random.normal(0, 0.2, count)
+            wind_speed = np.abs(random.gamma(1.5, 1.2, count))
+            humidity = np.clip(75 - 10 * daily + random.normal(0, 8, count), 10, 100)
+
+            data[station] = pd.DataFrame({
+                'air_temperature': air_temperature.round(1),
+                'humidity': humidity.round(0),
+                'wind_gust_max_10min': (wind_speed * 1.6).round(1),
+                'wind_speed_avg_10min': wind_speed.round(1),
+                'wind_force_avg_10min': np.clip(np.round((wind_speed / 0.836) ** (2 / 3)), 0, 12),
+                'wind_direction': random.uniform(0, 360, count).round(0),
+                'windchill': (air_temperature - wind_speed / 2).round(1),
+                'water_temperature': (12 + 8 * season + random.normal(0, 0.1, count)).round(1),
+                'barometric_pressure_qfe': (970 + 8 * np.sin(np.cumsum(random.normal(0, 0.01, count))) + random.normal(0, 0.2, count)).round(1),
+                'dew_point': (air_temperature - (100 - humidity) / 5).round(1)
+            }, index=index)
+        return data
+
+    def get_measurement_names(self):
+        """ (object) -> list
+        Returns the names of all measurements.
+        """
+        return list(self.measurements)
+
+    def read(self, measurement, fields, time_range, descending = False, limit = None):
+        """ (object, string, list, tuple, bool, int) -> object
+        Returns the given fields (None for all) of the rows of the measurement within the time range (see get_time_range)
+        with at least one value, indexed by utc time, in the given order and at most limit rows.
+        """
+        if not measurement in self.measurements:
+            return pd.DataFrame()
+        data = self.get_range(measurement, time_range)
+        fields = list(data.columns) if fields is None else [field for field in fields if field in data]
+        return self.select_rows(data, fields, descending, limit)
+
+    def write_points(self, dataframe, measurement, **arguments):
+        """ (object, object, string) -> void
+        Adds the given observations to the measurement. Observations of the same time are replaced.
+        """
+        data = dataframe.copy()
+        if data.index.tz is None:
+            data.index = data.index.tz_localize('UTC')
+
+        if measurement in self.measurements:
+            data = pd.concat([self.measurements[measurement], data])
+            data = data[~data.index.duplicated(keep='last')]
+        self.measurements[measurement] = data.sort_index()
+
+    def create_database(self, name):
+        """ (object, string) -> void
+        Does nothing, there is only one database.
+        """
+
+    def switch_database(self, name):
+        """ (object, string) -> void
+        Does nothing, there is only one database.
+        """
+
+    def drop_database(self, name):
+        """ (object, string) -> void
+        Removes all measurements.
+        """
+        self.measurements.clear()
+
+    def query(self, query_string, **arguments):
+        """ (object, string) -> object
+        Runs the given query. Multiple statements separated by a semicolon return a list of results.
+        Every result maps the measurement names to dataframes indexed by utc time.
+        """
+        statements = [statement for statement in query_string.split(';') if statement.strip()]
+        results = [self.query_statement(statement) for statement in statements]
+        return results[0] if len(results) == 1 else results
+
+    def query_statement(self, statement):
+        """ (object, string) -> dict
+        Runs a single statement.
+        """
+        # time range, grouping, order and limit
+        time_range = self.get_time_range(statement)
+        group = re.search(r'GROUP BY time\((\d+)([mhd])\)', statement)
+        limit = re.search(r'LIMIT (\d+)', statement)
+        limit = None if limit is None else int(limit.group(1))
+        descending = re.search(r'ORDER BY (time )?DESC', statement) is not None
+        measurements = self.get_measurements(statement)
+
+        if group is None:
+            # * are all fields
+            fields = [field.strip() for field in re.search(r'SELECT(.*?)FROM', statement, re.S).group(1).split(',')]
+            fields = None if fields == ['*'] else fields
+
+            result = {}
+            for measurement in measurements:
+                data = self.read(measurement, fields, time_range, descending, limit)
+                if not data.empty:
+                    result[measurement] = data
+            return result
+
+        # aggregate every time interval of every measurement, intervals without data are left out like fill(none)
+        interval = pd.Timedelta(int(group.group(1)), {'m': 'min', 'h': 'h', 'd': 'D'}[group.group(2)])
+        aggregations = re.findall(r'(MEAN|MIN|MAX|COUNT)\((\w+)\)(?:\s+AS\s+(\w+))?', statement[:statement.index('FROM')])
+        fields = list(dict.fromkeys(field for _, field, _ in aggregations))
+
+        result = {}
+        for measurement in measurements:
+            data = self.read(measurement, fields, time_range)
+            buckets = data.groupby(data.index.floor(interval))
+            columns = {}
+            for function, field, name in aggregations:
+                if field in data:
+                    columns[name or function.lower()] = getattr(buckets[field], function.lower())()
+            aggregated = pd.DataFrame(columns).dropna(how='all')
+
+            aggregated = aggregated.iloc[:limit] if limit is not None else aggregated
+            if not aggregated.empty:
+                result[measurement] = aggregated
+        return result
+
+    def get_measurements(self, statement):
+        """ (object, string) -> list
+        Returns the names of the measurements in the FROM clause of the statement.
+        """
+        names = self.get_measurement_names()
+        pattern = re.search(r'FROM\s+/(.+?)/', statement)
+        if pattern is not None:
+            return [measurement for measurement in sorted(names) if re.search(pattern.group(1), measurement)]
+        name = re.search(r'FROM\s+"?(\w+)"?', statement).group(1)
+        return [name] if name in names else []
+
+    def get_time_range(self, statement):
+        """ (object, string) -> tuple
+        Returns the utc start and end of the WHERE clause of the statement (None if unbounded)
+        and whether they are inclusive, as the sides to search them in a sorted index with.
+        """
+        start, start_side, end, end_side = None, 'left', None, 'right'
+        for operator, value in re.findall(r"time\s*(>=|>|<=|<)\s*'([^']+)'", statement):
+            if operator.startswith('>'):
+                start, start_side = pd.Timestamp(value, tz='UTC'), 'left' if operator == '>=' else 'right'
+            else:
+                end, end_side = pd.Timestamp(value, tz='UTC'), 'right' if operator == '<=' else 'left'
+        return start, start_side, end, end_side
+
+    def select_rows(self, data, fields, descending, limit):
+        """ (object, object, list, bool, int) -> object
+        Returns the given fields of the rows with at least one value in the given order, at most limit rows.
+        With a limit, only as many rows as needed are looked at, so the latest rows are found quickly.
+        """
+        data = data.iloc[::-1] if descending else data
+        if limit is None:
+            return data[fields].dropna(how='all')
+
+        # look at twice as many rows until enough rows with values are found
+        size = limit
+        while True:
+            rows = data.iloc[:size][fields].dropna(how='all')
+            if len(rows) >= limit or size >= len(data):
+                return rows.iloc[:limit]
+            size *= 2
+
+    def get_range(self, measurement, time_range):
+        """ (object, string, tuple) -> object
+        Returns the observations of the measurement within the time range (see get_time_range).
+        """
+        start, start_side, end, end_side = time_range
+        data = self.measurements[measurement]
+        first = 0 if start is None else data.index.searchsorted(start, side=start_side)
+        last = len(data) if end is None else data.index.searchsorted(end, side=end_side)
+        return data.iloc[first:last]
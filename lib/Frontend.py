@@ -1,33 +1,64 @@
-from dash.dependencies import Input, Output
+import dash
+from dash.dependencies import ClientsideFunction, Input, Output, State
 import dash_core_components as dcc
 import dash_html_components as html
-import plotly.express as px
-import pandas as pd
-import threading
+from flask import Response
 from datetime import datetime, timedelta
-import time
 import base64
+import json
 import os
+import threading
+import time
 
-from lib.Database import Database
-from lib.Prediction import Prediction
-from lib.Sync import Sync
+from lib.Job import Job
+from lib.MemoryBudget import MemoryBudget
+from lib.Metrics import Metrics
+from lib.Profiler import Profiler
 
 class Frontend:
 
-    def __init__(self, app):
-        """ (object) -> void
+    def __init__(self, app, database = None, sync = None):
+        """ (object, object, object, object) -> void
         Contructor of Frontend. Will initialize other classes and set default values.
+        The Database, Sync and Prediction classes are created in the background after the layout is served (see warm_up),
+        the optional database and sync replace the default ones, e.g. for benchmarks.
         """
         self.is_loading_prediction = False
 
-        # instanciate Database, Sync and Prediction classes and store in private variables
-        self.database = Database()
-        self.sync = Sync()
-        self.prediction = Prediction(self.database)
+        # the metrics are recorded unless WETTERMONITOR_METRICS=0 is set
+        # the entry points listed in WETTERMONITOR_PROFILE (e.g. prediction,callbacks,sync or all) are profiled
+        # WETTERMONITOR_MEMORY_BUDGET=<MiB> limits the cached data and keeps intermediate results small (low memory mode)
+        if database is None:
+            self.metrics = Metrics(enabled = os.environ.get('WETTERMONITOR_METRICS', '1') != '0')
+            self.profiler = Profiler(os.environ.get('WETTERMONITOR_PROFILE', ''))
+            budget = os.environ.get('WETTERMONITOR_MEMORY_BUDGET')
+            self.memory = MemoryBudget(None if budget is None else int(float(budget) * 2 ** 20), self.metrics)
+        else:
+            self.metrics, self.profiler, self.memory = database.metrics, database.profiler, database.memory
+
+        # Database, Sync and Prediction classes, None until they are created by warm_up
+        self.database = database
+        self.sync = sync
+        self.prediction = None
 
-        # create empty graph data to be able to display in UI
-        self.forecast_graph = {}
+        # error of the last failed warm up, None while it has not failed
+        self.warm_up_error = None
+
+        # compact forecast data sent to the browser (see get_forecast_data) and the changes from the previous forecast
+        self.forecast = None
+        self.forecast_patch = None
+
+        # time of the newest observation the forecast graph is based on
+        self.forecast_time = None
+
+        # number of best matching past days forming the forecast, set by WETTERMONITOR_ENSEMBLE (1 shows the single best day)
+        self.ensemble_size = int(os.environ.get('WETTERMONITOR_ENSEMBLE', '1'))
+
+        # check for new observations every minute in the background and calculate the temperature prediction when they arrive
+        # the peak memory of every cycle is recorded and the memory budget enforced afterwards
+        self.load_day = self.profiler.stage('Frontend.load_day', self.load_day)
+        self.load_ensemble = self.profiler.stage('Frontend.load_ensemble', self.load_ensemble)
+        self.prediction_job = Job(self.memory.wrap('wettermonitor_prediction_cycle', self.wrap_entry('prediction', 'wettermonitor_prediction_cycle', self.update_forecast)), interval = 60)
 
         # store dash instance in private variable
         self.app = app
@@ -36,32 +67,34 @@ class Frontend:
         """ (void) -> void
         Function to run the weatherstation UI.
         """
-        # import all historic data and continously load latest data
-        self.sync.import_data_async(True)
-
-        # start the prediction calculation loop in new thread
-        threading.Thread(target = self.run_prediction_periodic).start()
-
         # read no internet image
         no_wifi_image = base64.b64encode(open(os.getcwd() + '/assets/no-wifi.png', 'rb').read()).decode()
 
-        # define dash callback function, runs self.update_text
+        # define dash callback function, runs self.update_tick
+        # a single request per tick updates the measurements, the no internet sign, the pressure trend and the forecast data
         self.app.callback(Output('air-temperature', 'children'),
                 Output('water-temperature', 'children'),
                 Output('wind-speed', 'children'),
                 Output('wind-force', 'children'),
                 Output('wind-direction', 'children'),
                 Output('no-wifi-sign', 'hidden'),
-                [Input('interval-component', 'n_intervals')])(self.update_text)
+                Output('forecast-pressure', 'children'),
+                Output('forecast-data', 'data'),
+                [Input('interval-component', 'n_intervals')],
+                [State('forecast-version', 'data')])(self.wrap_entry('callbacks', 'wettermonitor_callback', self.update_tick, callback = 'update_tick'))
 
+        # draw the forecast in the browser from the forecast data (see assets/forecast.js)
+        self.app.clientside_callback(ClientsideFunction(namespace='wettermonitor', function_name='draw_forecast'),
+                Output('forecast-graph', 'figure'),
+                Output('forecast-version', 'data'),
+                [Input('forecast-data', 'data')])
 
-        # define dash callback function, runs self.update_prediction_text
-        self.app.callback(Output('forecast-pressure', 'children'),
-                [Input('interval-component', 'n_intervals')])(self.update_prediction_text)
+        # serve the metrics to be scraped by prometheus
+        if self.metrics.enabled:
+            self.app.server.route('/metrics')(self.get_metrics)
 
-        # define dash callback function, runs self.update_prediction_graph
-        self.app.callback(Output('forecast-graph', 'figure'),
-                [Input('interval-component', 'n_intervals')])(self.update_prediction_graph)
+        # tell the kiosk browser that the server is up (see autostart.sh)
+        self.app.server.route('/ready')(self.get_readiness)
 
         # set dash's user interface layout in html like style
         self.app.layout = html.Div(children=[
@@ -136,7 +169,7 @@ class Frontend:
                                         children=[
                                             dcc.Graph(
                                                 id='forecast-graph',
-                                                figure=self.forecast_graph
+                                                figure=self.get_placeholder_graph()
                                             )
                                         ]
                                     )
@@ -160,13 +193,88 @@ class Frontend:
                 # interval in milliseconds
                 interval=60000,
                 n_intervals=0
-            )
+            ),
+
+            # forecast data sent by the server and the version of the forecast drawn by the browser
+            dcc.Store(id='forecast-data'),
+            dcc.Store(id='forecast-version')
         ])
 
+        # the layout is served right away, the database, the sync and the prediction are started in the background
+        threading.Thread(target = self.warm_up, daemon = True).start()
+
+    def warm_up(self, retry_delay = 5, max_retry_delay = 300):
+        """ (object, int, int) -> void
+        Creates the Database, Sync and Prediction classes and starts the background work (see start_background_work). It runs in its own thread
+        after the layout is set, their imports (pandas and numpy) and the local storage take a while. Until it is done, the tick shows the loading values.
+        If it fails, the error is reported at /ready and it is tried again after retry_delay seconds, twice as long after every further failure
+        (at most max_retry_delay seconds).
+        """
+        delay = retry_delay
+        while True:
+            try:
+                self.start_background_work()
+                self.warm_up_error = None
+                return
+            except Exception as err:
+                print(f'Could not warm up ({err}), trying again in {delay}s')
+                self.warm_up_error = str(err)
+                time.sleep(delay)
+                delay = min(delay * 2, max_retry_delay)
+
+    def start_background_work(self):
+        """ (void) -> void
+        Creates the Database, Sync and Prediction classes and starts the sync and the prediction job.
+        Classes created and work started by a failed try before are kept, so it can be called again after a failure.
+        """
+        # imported here, so the layout is served without waiting for them
+        from lib.Prediction import Prediction
+
+        if self.database is None:
+            from lib.Database import Database
+            from lib.SqliteBackend import SqliteBackend
+            from lib.StationRegistry import StationRegistry
+            from lib.Storage import Storage
+
+            # WETTERMONITOR_BACKEND=sqlite keeps the observations in an embedded SQLite file instead of the influxdb server
+            client = SqliteBackend() if os.environ.get('WETTERMONITOR_BACKEND', 'influxdb') == 'sqlite' else None
+            # WETTERMONITOR_STATIONS=<station>,<station>,... sets the synced and averaged stations
+            stations = StationRegistry(os.environ.get('WETTERMONITOR_STATIONS', 'mythenquai,tiefenbrunnen').split(','))
+            self.database = Database(client = client, storage = Storage(stations = stations), metrics = self.metrics, profiler = self.profiler, memory = self.memory, stations = stations)
+
+        if self.sync is None:
+            from lib.Sync import Sync
+            self.sync = Sync(self.database)
+
+        # the callbacks use them as soon as the prediction is set
+        if self.prediction is None:
+            self.prediction = Prediction(self.database)
+
+        # calculate the prediction as soon as the sync has imported new data
+        if not self.update_new_data in self.sync.listeners:
+            self.sync.listeners.append(self.update_new_data)
+
+        # import all historic data and continously load latest data in the background
+        self.sync.import_data_async(True)
+
+        # monitor the internet connection in the background
+        self.sync.connectivity.start()
+
+        # start the prediction calculation loop in new thread
+        self.prediction_job.start()
+
+    def update_new_data(self, changed):
+        """ (object, dict) -> void
+        Listener of the sync, called after new data has been imported with the changed slots of the local storage.
+        The kept scores of the prediction are dropped if past observations changed, then the forecast is calculated again.
+        """
+        self.prediction.invalidate_scores(changed)
+        self.prediction_job.trigger()
+
     # Use this function for weather forecast visualization
     def load_day(self, date):
-        """ (object) -> px.line
-        Loads a specific day from the database, displays it in the forecast graph and returns it.
+        """ (object) -> dict
+        Loads a specific day from the database and returns it as forecast data (see get_forecast_data) or None if there is no data.
         """
         if date != None:
             # load specific date from database
@@ -174,37 +282,98 @@ class Frontend:
 
             # only update view if there is any data
             if not overview_data is None and overview_data.empty == False:
-                # create and set new forecast graph (make mean of the two stations and then make a graph of the means)
-                grouped_overview_data = overview_data.groupby(overview_data.index)
-                mean_overview_data = grouped_overview_data.mean()
-
-                # define date as offset from now
-                mean_overview_data.index = self.database.get_time_rounded(datetime.utcnow()) + (mean_overview_data.index - date)
+                # take the mean of all stations, aligned by the time after the date
+                temperatures = overview_data.xs('mean', axis=1, level=1)['air_temperature']
+                temperatures.index = temperatures.index - date
+
+                # the forecast starts at the current temperature, the temperatures of the day stay the same when it slides on
+                return self.get_forecast_data({'air_temperature': temperatures}, offset = -temperatures.iloc[0])
+        return None
+
+    def load_ensemble(self, dates, percentiles = (10, 90)):
+        """ (object, list, tuple) -> dict
+        Loads the days following all given dates from the database in a single request and returns their median
+        and the band between the given percentiles as forecast data (see get_forecast_data) or None if there is no data.
+        """
+        if dates != None and len(dates) > 0:
+            # load all days at once and align them by the time after their date
+            trajectories = {}
+            for date, overview_data in zip(dates, self.database.get_data_specific_dates(dates)):
+                if not overview_data is None and overview_data.empty == False:
+                    temperatures = overview_data.xs('mean', axis=1, level=1)['air_temperature']
+                    temperatures.index = temperatures.index - date
+                    trajectories[date] = temperatures
 
-                # adjust all temperatures to current temperature
-                mean_overview_data = self.adjust_forecast_to_current_values(mean_overview_data)
+            # only update view if there is any data
+            if len(trajectories) > 0:
+                # loaded by warm_up before the first forecast
+                import pandas as pd
 
-                # line plot
-                self.forecast_graph = px.line(mean_overview_data, x=mean_overview_data.index, y="air_temperature",
-                    color_discrete_sequence=['blue'], labels=dict(index="Time", air_temperature="Air Temperature"),
-                    title="Temperature Forecast")
-        return self.forecast_graph
+                ensemble = pd.DataFrame(trajectories).sort_index()
 
-    def adjust_forecast_to_current_values(self, temperature_list):
-        """ (dataframe) -> dataframe
-            Adjust the temperatures of the forecast to the current temperature.
-        """
-        # get last temperature
-        last_data = self.database.get_last_data()
+                # every day starts at the current temperature, same as a single day
+                ensemble = ensemble - ensemble.bfill().iloc[0]
 
-        # get the difference of current temperature and forecast temperatures
-        difference = last_data['air_temperature'] - temperature_list.head(1).iloc[0]["air_temperature"]
+                median = ensemble.median(axis=1)
+                lower, upper = [ensemble.quantile(percentile / 100, axis=1) for percentile in percentiles]
 
-        # add the difference to the forecast temperatures
-        temperature_list = temperature_list + difference
+                # band between the percentiles with the median on top
+                return self.get_forecast_data({'lower': lower, 'upper': upper, 'median': median}, f'{percentiles[0]}-{percentiles[1]}%')
+        return None
 
-        # return the adjusted temperature list
-        return temperature_list
+    def get_forecast_data(self, series, band = None, offset = 0):
+        """ (dict, string, float) -> dict
+        Returns the forecast series (temperatures indexed by the time after now) as compact data drawn by the browser
+        (see assets/forecast.js): the start time and the step between the values in milliseconds, the values of every series
+        on a 10 minute grid (None where missing) and the offset added to them, the current temperature plus the given offset.
+        The band is the name of the band between the series 'lower' and 'upper'.
+        """
+        import numpy as np
+        import pandas as pd
+
+        step = pd.Timedelta(minutes=10)
+        length = int(max(values.index.max() for values in series.values()) // step) + 1
+        grid = pd.timedelta_range(0, periods=length, freq=step)
+
+        # define date as offset from now
+        start = pd.Timestamp(self.database.get_time_rounded(datetime.utcnow()))
+
+        values = {}
+        for name, series_values in series.items():
+            rounded = series_values.reindex(grid).astype(np.float64).round(2)
+            values[name] = rounded.astype(object).where(rounded.notna(), None).tolist()
+
+        return {
+            'start': int(start.value // 10 ** 6),
+            'step': int(step.value // 10 ** 6),
+            'offset': round(float(self.database.get_last_data()['air_temperature'] + offset), 2),
+            'series': values,
+            'band': band
+        }
+
+    def get_forecast_patch(self, previous, forecast):
+        """ (dict, dict) -> dict
+        Returns the changes from the previous to the given forecast data: the values dropped at the start (shift),
+        the number of the following values kept, the changed values by position and the values appended.
+        The whole forecast is returned if it is not larger.
+        """
+        full = dict(forecast, type='full')
+        shift, remainder = divmod(forecast['start'] - previous['start'], forecast['step'])
+        if shift < 0 or remainder != 0 or forecast['step'] != previous['step'] or forecast['series'].keys() != previous['series'].keys() or forecast['band'] != previous['band']:
+            return full
+
+        series = {}
+        for name, values in forecast['series'].items():
+            kept = previous['series'][name][shift:shift + len(values)]
+            series[name] = {
+                'keep': len(kept),
+                'set': [[position, value] for position, (old_value, value) in enumerate(zip(kept, values)) if old_value != value],
+                'append': values[len(kept):]
+            }
+
+        patch = {'type': 'patch', 'base': previous['version'], 'version': forecast['version'], 'shift': shift,
+            'start': forecast['start'], 'offset': forecast['offset'], 'series': series}
+        return patch if len(json.dumps(patch)) < len(json.dumps(full)) else full
 
     def is_data_uptodate(self, last_data):
         """ (object) -> bool
@@ -214,15 +383,44 @@ class Frontend:
             return True
         return False
 
-    def update_text(self, n):
-        """ (int) -> string, string, string, string
-        Callback function for the UI measurement values.
+    def update_tick(self, n, version):
+        """ (int, string) -> tuple
+        Callback function updating the whole UI every tick: the measurement values and the no internet sign (see update_text),
+        the pressure trend (see update_prediction_text) and the forecast data (see update_prediction_graph).
+        All of them are based on the same snapshot of the latest observations. The parts are cheap and run one after another,
+        a failing part shows its fallback value and does not stop the others. The loading values are shown until warm_up is done.
+        """
+        if self.prediction is None:
+            return ('🔄', '🔄', '🔄', '🔄', '🔄', dash.no_update, '', dash.no_update)
+
+        snapshot = self.database.get_snapshot()
+
+        texts = self.update_part('update_text', ('🔄', '🔄', '🔄', '🔄', '🔄', dash.no_update), self.update_text, n, snapshot)
+        trend = self.update_part('update_prediction_text', '', self.update_prediction_text, n, snapshot)
+        forecast = self.update_part('update_prediction_graph', dash.no_update, self.update_prediction_graph, n, version)
+        return tuple(texts) + (trend, forecast)
+
+    def update_part(self, name, fallback, target, *args):
+        """ (object, string, object, function) -> object
+        Returns the result of the given part of the tick (see update_tick) or the fallback value if it fails.
+        Failures are printed and counted in wettermonitor_callback_errors_total.
+        """
+        try:
+            return target(*args)
+        except Exception as err:
+            print(f'{name} failed: {err}')
+            self.metrics.increment('wettermonitor_callback_errors_total', callback = name)
+            return fallback
+
+    def update_text(self, n, snapshot = None):
+        """ (int, dict) -> string, string, string, string
+        Callback function for the UI measurement values. The snapshot of the latest observations may be given (see Database.get_snapshot).
         """
         # check if no internet symbol has to be hidden
         hide_internet_symbol = self.sync.has_internet_connection()
 
         # read the latest data observation from the database
-        last_data = self.database.get_last_data()
+        last_data = self.database.get_last_data() if snapshot is None else snapshot['last_data']
 
         # check if the loaded data is empty or loading
         if last_data.empty or self.sync.is_syncing:
@@ -233,38 +431,108 @@ class Frontend:
             # return the newly read data
             return last_data['air_temperature'], last_data['water_temperature'], last_data['wind_speed_avg_10min'], last_data['wind_force_avg_10min'], last_data['wind_direction'], hide_internet_symbol
 
-    def update_prediction_text(self, n):
-        """ (int) -> string
-        Callback function for calculating the air pressure prediction.
+    def update_prediction_text(self, n, snapshot = None):
+        """ (int, dict) -> string
+        Callback function for calculating the air pressure prediction. The snapshot of the latest observations may be given.
         """
         # calculate the prediction
-        prediction = self.prediction.predict_press()
+        prediction = self.prediction.predict_press(None if snapshot is None else snapshot['last_five_hours'])
 
         # return the prediction outcome sign to display in the UI
         return prediction
 
-    def update_prediction_graph(self, n):
-        """ (int) -> string
-        Callback function to return the periodically calculated prediction graph.
+    def update_prediction_graph(self, n, version):
+        """ (int, string) -> dict
+        Callback function sending the periodically calculated forecast to the browser, where it is drawn (see assets/forecast.js).
+        The browser tells which version of the forecast it shows: nothing is sent if it is the current one,
+        only the changes if it is the previous one and the whole forecast otherwise. It never waits for the calculation.
         """
-        # create graph on initial load
-        while self.forecast_graph == {}:
-            self.load_day(self.prediction.predict_temp())
+        patch = self.forecast_patch
+        forecast = self.forecast
+        if forecast is None or version == forecast['version']:
+            return dash.no_update
+
+        # the patch may belong to the forecast before a forecast calculated in the meantime
+        if patch is not None and patch['type'] == 'patch' and version == patch['base'] and patch['version'] == forecast['version']:
+            return patch
+        return dict(forecast, type='full')
+
+    def get_placeholder_graph(self):
+        """ (void) -> dict
+        Returns an empty graph to display while the first prediction is calculated.
+        """
+        return {
+            'layout': {
+                'title': 'Temperature Forecast',
+                'xaxis': {'visible': False},
+                'yaxis': {'visible': False},
+                'annotations': [{
+                    'text': 'Calculating forecast...',
+                    'showarrow': False,
+                    'xref': 'paper',
+                    'yref': 'paper',
+                    'x': 0.5,
+                    'y': 0.5
+                }]
+            }
+        }
+
+    def wrap_entry(self, entry, metric, target, **labels):
+        """ (object, string, string, function, dict) -> function
+        Returns the target function measured as the given metric and profiled as the given entry point, see Metrics and Profiler.
+        """
+        return self.metrics.wrap(metric, self.profiler.wrap(entry, target), **labels)
 
-        # return the graph from the private variable
-        return self.forecast_graph
+    def get_metrics(self):
+        """ (void) -> object
+        Returns the recorded metrics in the prometheus text format, served at /metrics.
+        """
+        return Response(self.metrics.render(), mimetype = 'text/plain; version=0.0.4')
 
-    def run_prediction_periodic(self):
-        """ (void) -> void
-        Function to periodically calculate the temperature prediction.
-        It is meant to be called once and will run until the sofware is shut down.
+    def get_readiness(self):
+        """ (void) -> object
+        Returns which parts of the software have warmed up as json, served at /ready.
+        It answers as soon as the layout is served, the database, the historic sync and the forecast follow in the background.
+        While the warm up has failed, the error is returned too with the status 503 (see warm_up).
+        """
+        readiness = {
+            'layout': True,
+            'database': self.prediction is not None and self.sync.is_connected,
+            'sync': self.prediction is not None and not self.sync.is_syncing,
+            'forecast': self.forecast is not None
+        }
+        error = self.warm_up_error
+        if error is not None:
+            readiness['error'] = error
+            return Response(json.dumps(readiness), status = 503, mimetype = 'application/json')
+        return Response(json.dumps(readiness), mimetype = 'application/json')
+
+    def update_forecast(self):
+        """ (void) -> object
+        Calculates the temperature prediction and returns the new forecast data.
+        It is run by the prediction job and returns None if no new observation has arrived or no new forecast could be created.
         """
-        # loop runs until the software is closed down
-        while(True):
-            # wait 1 min time to reevaluate
-            time.sleep(60)
-
-            # check if graph has been initialized and no data is loading
-            if self.forecast_graph != {} and self.sync.is_syncing == False:
-                # calulcates and shows the temperature prediction in the forecast_graph
-                self.load_day(self.prediction.predict_temp())
+        # check if forecast has been initialized and data is loading
+        if self.forecast is not None and self.sync.is_syncing:
+            return None
+
+        # only calculate again when a new observation has arrived
+        newest_time = self.database.get_snapshot()['time']
+        if self.forecast is not None and newest_time == self.forecast_time:
+            return None
+
+        # calulcates the temperature prediction
+        if self.ensemble_size > 1:
+            forecast = self.load_ensemble(self.prediction.predict_temp_ensemble(self.ensemble_size))
+        else:
+            forecast = self.load_day(self.prediction.predict_temp())
+        if forecast is None:
+            return None
+
+        # every forecast is a new version, browsers showing the previous one only receive the changes (see update_prediction_graph)
+        forecast['version'] = f'{datetime.utcnow():%Y%m%d%H%M%S%f}'
+        self.forecast_patch = None if self.forecast is None else self.get_forecast_patch(self.forecast, forecast)
+        self.forecast = forecast
+
+        self.forecast_time = newest_time
+        return forecast
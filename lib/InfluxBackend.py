@@ -0,0 +1,115 @@
+import pandas as pd
+
+from lib.Backend import Backend
+
+
+class InfluxBackend(Backend):
+
+    def __init__(self, connection):
+        """ (object, object) -> void
+        Constructor of InfluxBackend. Reads the observations from the influxdb server through the clients of the given connection
+        (see Connection). Aggregations are calculated by the server, multiple windows are sent in a single request.
+        """
+        self.connection = connection
+
+    def query(self, query_string):
+        """ (object, string) -> object
+        Runs the given InfluxQL query. Multiple statements separated by a semicolon return a list of results.
+        """
+        with self.connection.client() as client:
+            return client.query(query_string)
+
+    def query_statements(self, statements):
+        """ (object, list) -> list
+        Runs all given statements in a single request and returns one result per statement.
+        """
+        if len(statements) == 0:
+            return []
+        result = self.query(';'.join(statements))
+
+        # a single statement returns a single result
+        results = result if isinstance(result, list) else [result]
+        if len(results) != len(statements):
+            raise ValueError(f'Expected {len(statements)} results, got {len(results)}')
+        return results
+
+    def get_source(self, stations):
+        """ (object, list) -> string
+        Returns the FROM clause of the given stations.
+        """
+        if len(stations) == 1:
+            return f'"{stations[0]}"'
+        return '/^(' + '|'.join(stations) + ')$/'
+
+    def get_time(self, date):
+        """ (object, object) -> string
+        Returns the given utc date as a time literal.
+        """
+        return date.strftime('%Y-%m-%d %H:%M:%S')
+
+    def get_last(self, stations, fields):
+        """ (object, list, list) -> dict
+        Returns the latest observation of every station with a value of any of the given fields (None for all fields) as a dataframe of one row.
+        """
+        fields = '*' if fields is None else ',\n'.join(fields)
+        return self.query(f'''
+                                SELECT
+                                {fields}
+                                FROM {self.get_source(stations)}
+                                ORDER BY DESC LIMIT 1
+                            ''')
+
+    def read_range(self, stations, fields, start_date, end_date = None, limit = None):
+        """ (object, list, list, object, object, int) -> dict
+        Returns the observations of the given fields of every station from start_date (inclusive) until end_date (exclusive, None for all),
+        oldest first and at most limit observations per station. Observations without any of the fields are left out.
+        """
+        end_string = '' if end_date is None else f"AND time < '{self.get_time(end_date)}'"
+        limit_string = '' if limit is None else f'LIMIT {limit}'
+
+        return self.query(f'''
+                                SELECT
+                                {', '.join(fields)}
+                                FROM {self.get_source(stations)}
+                                WHERE time >= '{self.get_time(start_date)}' {end_string}
+                                ORDER BY ASC {limit_string}
+                        ''')
+
+    def read_windows(self, stations, fields, windows, interval = '10m', limit = None, function = 'mean'):
+        """ (object, list, list, list, string, int, string) -> list
+        Returns the mean (or the 'min', 'max' or 'count', see function) of the given fields of every station per interval ('10m', '1h' or '1d')
+        within every (start, end) window (both exclusive), as one result per window. The aggregations are calculated by the server,
+        so only one row per interval and station is transferred. All windows are read in a single request.
+        """
+        means = ',\n'.join(f'{function.upper()}({field}) AS {field}' for field in fields)
+        limit_string = '' if limit is None else f'LIMIT {limit}'
+
+        return self.query_statements([f'''
+                                SELECT
+                                {means}
+                                FROM {self.get_source(stations)}
+                                WHERE time > '{self.get_time(start_date)}' AND time < '{self.get_time(end_date)}'
+                                GROUP BY time({interval}) fill(none)
+                                {limit_string}
+                        ''' for start_date, end_date in windows])
+
+    def count_windows(self, station, field, windows, interval = '10m'):
+        """ (object, string, string, list, string) -> list
+        Returns the number of observations of the given field of the station per interval within every [start, end) window,
+        as one series per window indexed by the start of the intervals. All windows are counted in a single request.
+        """
+        results = self.query_statements([f'''
+                                SELECT
+                                COUNT({field})
+                                FROM "{station}"
+                                WHERE time >= '{self.get_time(start_date)}' AND time < '{self.get_time(end_date)}'
+                                GROUP BY time({interval}) fill(none)
+                        ''' for start_date, end_date in windows])
+
+        return [result[station]['count'].rename(field) if station in result else self.get_empty_counts(field) for result in results]
+
+    def get_empty_counts(self, field):
+        """ (object, string) -> object
+        Returns a series of counts without any interval.
+        """
+        return pd.Series([], index=pd.DatetimeIndex([], tz='UTC'), dtype='int64', name=field)
@@ -0,0 +1,82 @@
+from datetime import datetime
+import threading
+
+
+class Job:
+
+    def __init__(self, target, interval = 60, retry_interval = 5):
+        """ (object, function, int, int) -> void
+        Constructor of Job. Sets the function to run in the background and how often to run it (in seconds).
+        Until the function returned its first result, it is retried every retry_interval seconds.
+        """
+        self.target = target
+        self.interval = interval
+        self.retry_interval = retry_interval
+
+        # last completed result and when it was completed
+        self.result = None
+        self.finished = None
+        self.error = None
+
+        # single flight guard, only one run at a time
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """ (object) -> void
+        This function starts running the job periodically in a seperate thread. The first run starts immediately.
+        """
+        if self.thread is None:
+            self.thread = threading.Thread(target = self.run_periodic, daemon = True)
+            self.thread.start()
+
+    def run_periodic(self):
+        """ (object) -> void
+        This function runs the job until the software is shut down.
+        """
+        while True:
+            self.run()
+
+            # wait for the next run or until the job is triggered
+            self.wake.wait(self.interval if self.result is not None else self.retry_interval)
+            self.wake.clear()
+
+    def run(self):
+        """ (object) -> bool
+        This function runs the job once in the calling thread and stores its result if it is not None.
+        It returns false without running if the job is already running.
+        """
+        if not self.lock.acquire(blocking = False):
+            return False
+        try:
+            result = self.target()
+            if result is not None:
+                self.result = result
+                self.finished = datetime.utcnow()
+            self.error = None
+        except Exception as err:
+            # keep the last result, try again next time
+            self.error = err
+            print(err)
+        finally:
+            self.lock.release()
+        return True
+
+    def trigger(self):
+        """ (object) -> void
+        This function makes the background thread run the job now instead of waiting for the next interval.
+        """
+        self.wake.set()
+
+    def is_running(self):
+        """ (object) -> bool
+        This function returns true while the job is running.
+        """
+        return self.lock.locked()
+
+    def get_result(self, default = None):
+        """ (object, object) -> object
+        This function returns the last completed result without waiting, or default if there is none yet.
+        """
+        return default if self.result is None else self.result
@@ -0,0 +1,117 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import argparse
+import glob
+import os
+import re
+import time
+import numpy as np
+import pandas as pd
+
+from lib.Connection import Connection
+
+
+class Loader:
+
+    def __init__(self, connection = None, folder = 'data', chunksize = 10000, batch_size = 5000, max_workers = 2):
+        """ (object, object, string, int, int, int) -> void
+        Constructor of Loader. Sets the database connection and the folder of the messwerte_<station>_<year>.csv files.
+        Files are read in chunks of chunksize rows and written in batches of batch_size points,
+        with at most max_workers files loaded at the same time, so the memory usage stays bounded.
+        """
+        self.connection = Connection(max_clients = max_workers) if connection is None else connection
+        self.folder = folder
+        self.chunksize = chunksize
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+
+    def get_files(self):
+        """ (object) -> list
+        This function returns (path, station) of all measurement files in the folder, ordered by name.
+        """
+        files = []
+        for path in sorted(glob.glob(os.path.join(self.folder, 'messwerte_*_*.csv'))):
+            match = re.match(r'messwerte_(.+)_[0-9-]+\.csv$', os.path.basename(path))
+            if match is not None:
+                files.append((path, match.group(1)))
+        return files
+
+    def get_years(self, path):
+        """ (object, string) -> int, int
+        This function returns the first and last year of the given file, e.g. (2007, 2019) for messwerte_mythenquai_2007-2019.csv.
+        """
+        years = re.search(r'_([0-9]{4})(?:-([0-9]{4}))?\.csv$', path)
+        if years is None:
+            return None, None
+        return int(years.group(1)), int(years.group(2) or years.group(1))
+
+    def load_file(self, path, station, ranges = None):
+        """ (object, string, string, list) -> int
+        This function writes all measurements of the given file into the database and returns the number of rows.
+        If ranges is given, only measurements within one of the utc (start, end) ranges are written.
+        """
+        rows = 0
+        start = time.perf_counter()
+
+        if ranges is not None:
+            # skip files without any year of the ranges (one day margin for the timezone)
+            first_year, last_year = self.get_years(path)
+            if first_year is not None and not any((start_date - timedelta(days = 1)).year <= last_year and (end_date + timedelta(days = 1)).year >= first_year for start_date, end_date in ranges):
+                return 0
+            starts = np.array([start_date for start_date, end_date in ranges], dtype = 'datetime64[ns]')
+            ends = np.array([end_date for start_date, end_date in ranges], dtype = 'datetime64[ns]')
+            order = np.argsort(starts)
+            starts, ends = starts[order], ends[order]
+
+        for chunk in pd.read_csv(path, delimiter = ',', chunksize = self.chunksize):
+            # convert cet to utc, same as the weatherstation library does
+            chunk.index = pd.to_datetime(chunk.pop('timestamp_cet'), format = '%Y-%m-%dT%H:%M:%S') - timedelta(hours = 1)
+            chunk.index.name = 'timestamp'
+            chunk = chunk.astype(np.float64)
+
+            if ranges is not None:
+                # keep rows within the range starting last before them
+                times = chunk.index.to_numpy()
+                position = np.searchsorted(starts, times, side = 'right') - 1
+                chunk = chunk[(position >= 0) & (times < ends[np.maximum(position, 0)])]
+                if chunk.empty:
+                    continue
+
+            with self.connection.client() as client:
+                client.write_points(chunk, station, time_precision = 's', database = self.connection.database, protocol = 'line', batch_size = self.batch_size)
+            rows += len(chunk)
+
+        duration = time.perf_counter() - start
+        print(f'Loaded {rows} rows of {station} from {path} in {duration:.1f}s ({rows / max(duration, 1e-9):.0f} rows/s)')
+        return rows
+
+    def run(self):
+        """ (object) -> int
+        This function loads all measurement files into the database and returns the number of rows.
+        """
+        files = self.get_files()
+        if len(files) == 0:
+            print('No measurement files found in ' + self.folder)
+            return 0
+
+        start = time.perf_counter()
+
+        # load several files at the same time
+        with ThreadPoolExecutor(max_workers = self.max_workers) as executor:
+            rows = sum(executor.map(lambda file: self.load_file(*file), files))
+
+        duration = time.perf_counter() - start
+        print(f'Loaded {rows} rows from {len(files)} files in {duration:.1f}s ({rows / max(duration, 1e-9):.0f} rows/s)')
+        return rows
+
+
+if __name__ == '__main__':
+    # python -m lib.Loader [folder] loads the measurement files without internet access
+    parser = argparse.ArgumentParser(description = 'Load the messwerte_<station>_<year>.csv files into the database.')
+    parser.add_argument('folder', nargs = '?', default = 'data')
+    parser.add_argument('--host', default = 'localhost')
+    parser.add_argument('--port', type = int, default = 8086)
+    parser.add_argument('--workers', type = int, default = 2)
+    arguments = parser.parse_args()
+
+    Loader(Connection(arguments.host, arguments.port, max_clients = arguments.workers), arguments.folder, max_workers = arguments.workers).run()
@@ -0,0 +1,121 @@
+import functools
+import threading
+import time
+
+from lib.Metrics import Metrics
+
+
+class MemoryBudget:
+
+    def __init__(self, limit = None, metrics = None):
+        """ (object, int, object) -> void
+        Constructor of MemoryBudget. Keeps the caches registered with it below limit bytes together by evicting
+        the least recently used caches first. Without a limit nothing is evicted. With a limit (low memory mode),
+        the classes using the budget also keep their intermediate results small, e.g. Database reads smaller chunks.
+        The cache sizes, the evictions and the peak memory of wrapped functions are recorded in the metrics.
+        """
+        self.limit = limit
+        self.metrics = Metrics(enabled = False) if metrics is None else metrics
+
+        # name -> (get_size, evict) of every cache and when it was last used
+        self.caches = {}
+        self.used = {}
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        """ (object) -> bool
+        True in low memory mode, if a limit is set.
+        """
+        return self.limit is not None
+
+    def register(self, name, get_size, evict):
+        """ (object, string, function, function) -> void
+        This function adds a cache to the budget. get_size returns its size in bytes, evict empties it.
+        A cache must be able to fill itself again after it has been evicted.
+        """
+        with self.lock:
+            self.caches[name] = (get_size, evict)
+            self.used[name] = time.monotonic()
+
+    def touch(self, name):
+        """ (object, string) -> void
+        This function marks the given cache as used, it is evicted after the caches used before.
+        """
+        # no lock, the caches may call this while holding their own lock
+        self.used[name] = time.monotonic()
+
+    def get_sizes(self):
+        """ (object) -> dict
+        This function returns the size in bytes of every cache.
+        """
+        with self.lock:
+            caches = dict(self.caches)
+        return {name: get_size() for name, (get_size, evict) in caches.items()}
+
+    def enforce(self):
+        """ (object) -> dict
+        This function evicts the least recently used caches until all caches together fit into the limit
+        and returns the sizes of the caches afterwards.
+        """
+        with self.lock:
+            sizes = {name: get_size() for name, (get_size, evict) in self.caches.items()}
+            total = sum(sizes.values())
+
+            if self.enabled:
+                for name in sorted(sizes, key = lambda name: self.used.get(name, 0)):
+                    if total <= self.limit:
+                        break
+                    if sizes[name] == 0:
+                        continue
+                    self.caches[name][1]()
+                    total -= sizes[name]
+                    sizes[name] = 0
+                    self.metrics.increment('wettermonitor_cache_evictions_total', cache = name)
+
+        for name, size in sizes.items():
+            self.metrics.set('wettermonitor_cache_bytes', size, cache = name)
+        return sizes
+
+    def reset_peak(self):
+        """ (object) -> bool
+        This function resets the peak resident memory of the process (Linux only) and returns true if it could.
+        """
+        try:
+            with open('/proc/self/clear_refs', 'w') as file:
+                file.write('5')
+            return True
+        except OSError:
+            return False
+
+    def get_peak(self):
+        """ (object) -> int
+        This function returns the peak resident memory of the process in bytes since the last reset_peak,
+        or since the start of the process if it cannot be reset.
+        """
+        try:
+            with open('/proc/self/status') as file:
+                for line in file:
+                    if line.startswith('VmHWM:'):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+
+        # ru_maxrss is in kilobytes on Linux
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def wrap(self, name, target):
+        """ (object, string, function) -> function
+        This function returns the target function recording the peak resident memory of every call as the gauge <name>_peak_rss_bytes
+        and enforcing the budget afterwards. The peak includes the memory used by other threads at the same time.
+        """
+        @functools.wraps(target)
+        def measured(*args, **kwargs):
+            self.reset_peak()
+            try:
+                return target(*args, **kwargs)
+            finally:
+                self.metrics.set(name + '_peak_rss_bytes', self.get_peak())
+                self.enforce()
+        return measured
@@ -0,0 +1,133 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+import functools
+import threading
+import time
+
+
+class Metrics:
+
+    def __init__(self, enabled = True, buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)):
+        """ (object, bool, tuple) -> void
+        Constructor of Metrics. Collects latency histograms (buckets in seconds), counters and gauges
+        and renders them in the Prometheus text format. If enabled is false, nothing is recorded.
+        """
+        self.enabled = enabled
+        self.buckets = list(buckets)
+
+        # (name, labels) -> bucket counts, sum and count of every histogram and value of every counter and gauge
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.lock = threading.Lock()
+
+    def observe(self, name, value, **labels):
+        """ (object, string, float, dict) -> void
+        This function records a value (e.g. a duration in seconds) in the given histogram.
+        """
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+
+            # only the first matching bucket is counted, render sums them up
+            position = bisect_left(self.buckets, value)
+            if position < len(self.buckets):
+                histogram[0][position] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def increment(self, name, value = 1, **labels):
+        """ (object, string, float, dict) -> void
+        This function adds the value to the given counter.
+        """
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """ (object, string, float, dict) -> void
+        This function sets the given gauge to the value, e.g. a size in bytes.
+        """
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.gauges[key] = value
+
+    @contextmanager
+    def measure(self, name, **labels):
+        """ (object, string, dict) -> void
+        This function records the duration of the with block in the histogram <name>_seconds.
+        Exceptions are counted in <name>_errors_total and raised again.
+        """
+        if not self.enabled:
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.increment(name + '_errors_total', **labels)
+            raise
+        finally:
+            self.observe(name + '_seconds', time.perf_counter() - start, **labels)
+
+    def wrap(self, name, target, **labels):
+        """ (object, string, function, dict) -> function
+        This function returns the target function measured like measure does.
+        """
+        @functools.wraps(target)
+        def measured(*args, **kwargs):
+            with self.measure(name, **labels):
+                return target(*args, **kwargs)
+        return measured
+
+    def format_labels(self, labels, extra = ()):
+        """ (object, tuple, tuple) -> string
+        This function returns the labels in the Prometheus text format, e.g. {job="latest"}.
+        """
+        labels = tuple(labels) + tuple(extra)
+        if len(labels) == 0:
+            return ''
+        return '{' + ','.join('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"')) for key, value in labels) + '}'
+
+    def render(self):
+        """ (object) -> string
+        This function returns all recorded metrics in the Prometheus text format.
+        """
+        with self.lock:
+            histograms = {key: (list(value[0]), value[1], value[2]) for key, value in self.histograms.items()}
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+
+        lines = []
+        types = set()
+        for metric_type, values in [('counter', counters), ('gauge', gauges)]:
+            for (name, labels), value in sorted(values.items()):
+                if not name in types:
+                    types.add(name)
+                    lines.append(f'# TYPE {name} {metric_type}')
+                lines.append(f'{name}{self.format_labels(labels)} {value}')
+
+        for (name, labels), (bucket_counts, total, count) in sorted(histograms.items()):
+            if not name in types:
+                types.add(name)
+                lines.append(f'# TYPE {name} histogram')
+
+            # buckets are cumulative
+            cumulative = 0
+            for bucket, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{self.format_labels(labels, [("le", bucket)])} {cumulative}')
+            lines.append(f'{name}_bucket{self.format_labels(labels, [("le", "+Inf")])} {count}')
+            lines.append(f'{name}_sum{self.format_labels(labels)} {total}')
+            lines.append(f'{name}_count{self.format_labels(labels)} {count}')
+
+        return '\n'.join(lines) + '\n'
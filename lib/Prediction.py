@@ -1,4 +1,5 @@
 from datetime import datetime, timedelta
+import threading
 import numpy as np
 import pandas as pd
 
@@ -10,15 +11,43 @@ class Prediction:
         # store the constructor parameter in a private variable
         self.database = database
 
-    def predict_temp(self):
-        """ (void) -> object
+        # terms of the last scored candidates, updated when the windows slide by one interval (see update_scores)
+        self.scores_state = None
+        self.rebuild_steps = 36
+        self.scores_generation = 0
+        self.scores_lock = threading.Lock()
+        database.memory.register('scores', self.get_scores_size, self.clear_scores)
+
+        # record the duration of every prediction
+        self.predict_temp = database.metrics.wrap('wettermonitor_prediction', database.profiler.stage('Prediction.predict_temp', self.predict_temp), function = 'predict_temp')
+        self.predict_temp_ensemble = database.metrics.wrap('wettermonitor_prediction', database.profiler.stage('Prediction.predict_temp_ensemble', self.predict_temp_ensemble), function = 'predict_temp_ensemble')
+        self.predict_press = database.metrics.wrap('wettermonitor_prediction', database.profiler.stage('Prediction.predict_press', self.predict_press), function = 'predict_press')
+
+    def predict_temp(self, years = None, days = 14, step = 1):
+        """ (int, int, int) -> object
         Function predicts the temperature with 30 data points in the future, corresponding to 5 hours from now.
         Prediction/Forecast is based on past years. Number of past years to use can easily be edited in this function.
+        With days set to None, every window of the whole history (every step 10-minute intervals) is compared
+        instead of the same time of day around the current day of the year, this needs the analog index of the local storage.
         For a quick howto, have a look in the software documentation.
         """
-        # load the data of all past years that is used for further comparison in the prediction
-        historic_match_data = self.database.get_data_comparison()
+        scores = self.score_analogs(years, days, step)
+        return None if scores is None else self.get_best_candidate(*scores)
+
+    def predict_temp_ensemble(self, k = 10, years = None, days = 14, step = 1):
+        """ (int, int, int, int) -> list
+        Function finds the k best matching past 5 hours (see predict_temp), best first.
+        Their following observations form an ensemble of forecasts.
+        """
+        scores = self.score_analogs(years, days, step, k)
+        return None if scores is None else self.get_top_candidates(*scores, k)
 
+    def score_analogs(self, years = None, days = 14, step = 1, k = 1):
+        """ (int, int, int, int) -> object, object
+        Function compares the last 5 hours with all candidate windows of the past (see predict_temp)
+        and returns the candidate window ends and their differences or None if there is no current data.
+        At least the k best candidates are returned.
+        """
         # load the data of the last 5 hours from now
         current_match_data = self.database.get_last_five_hours()
 
@@ -33,70 +62,222 @@ class Prediction:
         # get timestamp + 7 days from now so it is possible to count back 14 days to iterate through +/- 7 days
         date_now_seven = datetime.utcnow() + timedelta(days=7)
         date_now_seven = self.database.get_time_rounded(date_now_seven)
-        
-        # create empty dictionary for appending difference values later
-        difference_dict = {}
 
-        # find the best matching 5 hours in a timespan of +/- 7 days (14 days total)from now in the last 8 years
-        # YOU CAN CHANGE THE NUMBER (n) USED FOR PREDICTION IN: "for years in range(n)" according to your preferences
+        # find the best matching 5 hours in a timespan of +/- 7 days (14 days total) from now in all years since 2006
+        # YOU CAN CHANGE THE NUMBER OF YEARS USED FOR PREDICTION WITH THE PARAMETER "years" according to your preferences
         # but be aware of the fact that there is only data available back to 2006 and not further back!
-        # insert (1, date_now.year - 2006) for (n) if you always want to use the full range of available years.
-        # CHANGES MAY SLOW DOWN THE SYSTEM!
-        for years in range(8):
-            for days in range(14):
-                difference = 0
-                
-                # compare all 30 available datapoints for each specific days in the past
-                for ten_minute_interval in range(29):
-                    # calculate a 10-minute interval datapoint from last 5 hours
-                    current_datapoint = (date_now - timedelta(minutes=ten_minute_interval*10)).strftime('%Y-%m-%d %H:%M:%S')
-
-                    # calculate same date intervals in specific date from past years
-                    past_datapoint = (date_now_seven - timedelta(days=years*365+days, minutes=ten_minute_interval*10)).strftime('%Y-%m-%d %H:%M:%S')
-
-                    # get airtemperature values from the past with the same timestamps like +/- 7 days from now in current year
-                    if past_datapoint in historic_match_data.index and current_datapoint in current_match_data.index:
-                        # check if temperature is existent in both stations and has the right format
-                        if isinstance(historic_match_data['air_temperature'][past_datapoint], np.float64):
-                            # take the only available temperature for this date
-                            past_temperature = historic_match_data['air_temperature'][past_datapoint]
-                        else:
-                            # take the mean of both stations temperature for this date
-                            past_temperature = historic_match_data['air_temperature'][past_datapoint].mean(skipna=True)
-
-                        # check if temperature is existent in both stations and has the right format
-                        if isinstance(current_match_data['air_temperature'][current_datapoint], np.float64):
-                            # take the only available temperature for this date
-                            current_temperature = current_match_data['air_temperature'][current_datapoint]
-                        else:
-                            # take the mean of both stations temperature for this date
-                            current_temperature = current_match_data['air_temperature'][current_datapoint].mean(skipna=True)
-
-                        # get the absolute difference between each two data points between years and weight according to elapsed time
-                        difference += abs(past_temperature - current_temperature) * (30 - ten_minute_interval)
-
-                # write these differences in a dictionary of all differences with absolute time as index (if existent)
-                if difference > 0:
-                    difference_dict[date_now_seven - timedelta(days=years*365+days)] = difference
-
-        # find the minimum occuring difference in the difference dictionary
-        result = min(difference_dict, key=difference_dict.get)
-        return result
-
-    def predict_press(self):
-        """ (void) -> string
+        years = date_now.year - 2006 if years is None else years
+        candidates = self.get_candidates(date_now_seven, years, days or 0)
+        past_times, current_times = self.get_window_times(candidates, date_now)
+        current_values = self.lookup(self.get_station_mean(current_match_data, 'air_temperature'), current_times)
+
+        if self.database.has_storage():
+            self.database.memory.touch('storage')
+            if days is None:
+                # compare with every window of the whole history
+                self.database.memory.touch('analog_index')
+                return self.database.analog_index.search(current_values, date_now, step, k)
+
+            # update the scores of the last run if the windows only slid on, otherwise score all candidates again
+            return candidates, self.update_scores(candidates, past_times, current_values)
+        else:
+            # load the data of all past years that is used for further comparison in the prediction
+            historic_match_data = self.database.get_data_comparison()
+            if historic_match_data is None:
+                return None
+
+            # use the mean of all stations, so every timestamp holds exactly one temperature
+            past_values = self.lookup(self.get_station_mean(historic_match_data, 'air_temperature'), past_times)
+
+        # score all candidates at once
+        return candidates, self.score_candidates(past_values, current_values)
+
+    def update_scores(self, candidates, past_times, current_values):
+        """ (object, object, object) -> object
+        Returns the scores of all candidates (see score_candidates) from the analog index of the local storage.
+        If all windows slid on by one 10-minute interval since the last call, only the oldest term of every score is removed
+        and the newest added, terms of changed current values are replaced. All terms are calculated again every rebuild_steps calls.
+        """
+        intervals = current_values.shape[-1]
+        with self.scores_lock:
+            state = self.scores_state
+            generation = self.scores_generation
+
+        if state is not None and 0 < state['steps'] < self.rebuild_steps and np.array_equal(state['candidates'] + np.timedelta64(10, 'm'), candidates):
+            # current values that changed apart from sliding on, e.g. the oldest one leaving the last five hours
+            changed_ages = 1 + np.flatnonzero(~np.isclose(state['current_values'][:-1], current_values[1:], equal_nan=True))
+        else:
+            changed_ages = None
+
+        if changed_ages is not None and len(changed_ages) <= intervals // 4:
+            # the oldest term is stored in the column of the new term (ring buffer, one column per interval)
+            column = state['steps'] % intervals
+            oldest_terms = state['terms'][:, column].copy()
+            newest_terms = self.get_terms(past_times[:, 0], current_values[0])
+            state['terms'][:, column] = newest_terms
+
+            # every other term ages by one interval, its weight drops by one
+            state['weighted_sums'] += state['sums'] - oldest_terms * intervals
+            state['sums'] += newest_terms - oldest_terms
+            state['steps'] += 1
+
+            for age in changed_ages:
+                column = (state['steps'] + intervals - 1 - age) % intervals
+                terms = self.get_terms(past_times[:, age], current_values[age])
+                state['sums'] += terms - state['terms'][:, column]
+                state['weighted_sums'] += (terms - state['terms'][:, column]) * age
+                state['terms'][:, column] = terms
+        else:
+            terms = self.get_terms(past_times, current_values[None, :])
+
+            # the term of age k is stored in column -k, so the oldest term is in the column of the next new term
+            state = {'terms': np.roll(terms[:, ::-1], 1, axis=1), 'sums': terms.sum(axis=1), 'weighted_sums': (terms * np.arange(intervals)).sum(axis=1), 'steps': 1}
+
+        state['candidates'] = candidates
+        state['current_values'] = current_values
+        with self.scores_lock:
+            # the terms may have been calculated from past values that changed in the meantime
+            if self.scores_generation == generation:
+                self.scores_state = state
+        self.database.memory.touch('scores')
+
+        # the weight of a term is intervals + 1 minus its age
+        return (intervals + 1) * state['sums'] - state['weighted_sums']
+
+    def get_scores_size(self):
+        """ (object) -> int
+        Returns the size in bytes of the terms kept to update the scores.
+        """
+        state = self.scores_state
+        if state is None:
+            return 0
+        return sum(value.nbytes for value in state.values() if isinstance(value, np.ndarray))
+
+    def clear_scores(self):
+        """ (object) -> void
+        Drops the terms kept to update the scores, the next call of update_scores calculates all terms again.
+        """
+        with self.scores_lock:
+            self.scores_state = None
+            self.scores_generation += 1
+
+    def invalidate_scores(self, changed):
+        """ (object, dict) -> void
+        Drops the terms kept to update the scores if past values within the scored windows changed,
+        i.e. if the first changed 10 minute slot of any station (see Database.update_storage) is before the end
+        of the last comparison window (see Database.get_comparison_windows), the only past values scored.
+        """
+        storage = self.database.storage
+        if self.scores_state is None or not changed or storage is None:
+            return
+
+        first_changed = storage.origin + min(changed.values()) * storage.interval
+        last_end = max((self.database.to_local_time(end_date) for start_date, end_date in self.database.get_comparison_windows()), default = None)
+        if last_end is not None and first_changed <= np.datetime64(last_end, 'ns'):
+            self.clear_scores()
+
+    def get_terms(self, past_times, current_values):
+        """ (object, object) -> object
+        Returns the absolute differences between the past values at the given timestamps and the current values, 0 where either is missing.
+        """
+        return np.nan_to_num(np.abs(self.get_past_values(past_times) - current_values))
+
+    def get_past_values(self, past_times):
+        """ (object) -> object
+        Returns the station means at the given timestamps from the analog index of the local storage,
+        only within the same windows the database would return.
+        """
+        past_values = self.database.analog_index.get(past_times)
+        past_values[~self.database.get_comparison_mask(past_times)] = np.nan
+        return past_values
+
+    def get_best_candidate(self, candidates, difference):
+        """ (object, object) -> object
+        Returns the candidate with the smallest difference or None if there is no candidate with data.
+        """
+        # only keep candidates with existing data (same as a difference > 0 in the previous loop)
+        valid_candidates = np.flatnonzero(difference > 0)
+        if len(valid_candidates) == 0:
+            return None
+
+        # find the minimum occuring difference, the first one wins on equal differences
+        result = candidates[valid_candidates[np.argmin(difference[valid_candidates])]]
+        return pd.Timestamp(result).to_pydatetime()
+
+    def get_top_candidates(self, candidates, difference, k):
+        """ (object, object, int) -> list
+        Returns the k candidates with the smallest differences, best first, or None if there is no candidate with data.
+        """
+        valid_candidates = np.flatnonzero(difference > 0)
+        if len(valid_candidates) == 0:
+            return None
+
+        # select the k smallest differences without sorting all of them, then order only those
+        if len(valid_candidates) > k:
+            valid_candidates = valid_candidates[np.argpartition(difference[valid_candidates], k - 1)[:k]]
+        best = valid_candidates[np.lexsort((valid_candidates, difference[valid_candidates]))]
+        return [pd.Timestamp(candidate).to_pydatetime() for candidate in candidates[best]]
+
+    def get_station_mean(self, data, field):
+        """ (object, string) -> object
+        Returns a series of the given field with the mean of all stations per timestamp.
+        """
+        return data[field]['mean']
+
+    def get_candidates(self, date_now_seven, years, days):
+        """ (object, int, int) -> object
+        Returns an array of all candidate window ends, ordered by year and then by day.
+        """
+        # days to go back from date_now_seven for every year and day combination
+        offsets = (np.arange(years)[:, None] * 365 + np.arange(days)[None, :]).ravel()
+
+        return np.datetime64(date_now_seven, 'ns') - offsets * np.timedelta64(1, 'D')
+
+    def get_window_times(self, candidates, date_now, intervals = 29):
+        """ (object, object, int) -> object, object
+        Returns the timestamps of all candidate windows as a (candidates x intervals) matrix
+        and the timestamps of the current window, both going back in time in 10-minute steps.
+        """
+        # offsets of all 10-minute intervals within a window
+        steps = np.arange(intervals) * np.timedelta64(10, 'm')
+
+        return candidates[:, None] - steps[None, :], np.datetime64(date_now, 'ns') - steps
+
+    def lookup(self, series, times):
+        """ (object, object) -> object
+        Returns the values of the series at the given timestamps in the shape of times.
+        Missing timestamps become nan.
+        """
+        return series.reindex(pd.DatetimeIndex(times.ravel())).to_numpy(dtype=np.float64).reshape(times.shape)
+
+    def score_candidates(self, past_values, current_values):
+        """ (object, object) -> object
+        Returns the weighted difference between the current window and every candidate window.
+        Datapoints missing on either side do not count towards the difference.
+        """
+        intervals = current_values.shape[-1]
+
+        # weight according to elapsed time, the most recent interval weighs most
+        weights = intervals + 1 - np.arange(intervals)
+
+        return np.nansum(np.abs(past_values - current_values[None, :]) * weights[None, :], axis=1)
+
+    def predict_press(self, last_hours_data = None):
+        """ (object) -> string
         This function evaluates whether the weather might be going to get better, 
         a lot better, worse or a lot worse based on the change in air pressure.
+        The last five hours of data may be given, e.g. from a snapshot (see Database.get_snapshot).
         """
         # read the last five hours of data
-        last_hours_data = self.database.get_last_five_hours()
+        if last_hours_data is None:
+            last_hours_data = self.database.get_last_five_hours()
 
         # return an empty string if the data could not be loaded
         if last_hours_data is None or not 'barometric_pressure_qfe' in last_hours_data.columns:
             return ""
 
-        # extract pressure data from the data
-        pressure_data = last_hours_data['barometric_pressure_qfe']
+        # extract pressure data from the data (mean of all stations)
+        pressure_data = self.get_station_mean(last_hours_data, 'barometric_pressure_qfe')
 
         # convert the pandas dataset to a numpy array
         pressure_values = pressure_data.to_numpy()
@@ -104,6 +285,10 @@ class Prediction:
         # remove nans for the data to use
         pressure_values_nonan = pressure_values[np.logical_not(np.isnan(pressure_values))]
 
+        # return an empty string if there is no valid pressure measurement
+        if len(pressure_values_nonan) == 0:
+            return ""
+
         # take the first and oldest valid pressure measurement as the reference
         first_pressure = pressure_values_nonan[0]
 
@@ -0,0 +1,116 @@
+from datetime import datetime
+import cProfile
+import functools
+import glob
+import os
+import pstats
+import threading
+import time
+
+
+class Profiler:
+
+    def __init__(self, entries = '', folder = os.path.join('data', 'profiles'), max_dumps = 10):
+        """ (object, string, string, int) -> void
+        Constructor of Profiler. Sets the comma separated entry points to profile ('prediction', 'callbacks', 'sync' or 'all'),
+        the folder of the profile dumps and how many dumps of every entry point are kept.
+        Without entries nothing is profiled and the wrapped functions are returned unchanged.
+        """
+        self.entries = set(entry.strip() for entry in entries.split(',') if entry.strip() != '')
+        if 'all' in self.entries:
+            self.entries = {'prediction', 'callbacks', 'sync'}
+        self.folder = folder
+        self.max_dumps = max_dumps
+
+        # only one call is profiled at a time, the stages of the profiled call of every thread
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    @property
+    def enabled(self):
+        """ (object) -> bool
+        True if any entry point is profiled.
+        """
+        return len(self.entries) > 0
+
+    def wrap(self, entry, target, name = None):
+        """ (object, string, function, string) -> function
+        This function returns the target function profiled as the given entry point, if that entry point is profiled.
+        Every profiled call writes a profile dump and a timing breakdown of its stages, named after name (default the function name).
+        """
+        if not entry in self.entries:
+            return target
+        name = target.__name__ if name is None else name
+
+        @functools.wraps(target)
+        def profiled(*args, **kwargs):
+            # calls made while another call is profiled run without the profiler
+            if getattr(self.local, 'stages', None) is not None or not self.lock.acquire(False):
+                return target(*args, **kwargs)
+
+            profile = cProfile.Profile()
+            self.local.stages = []
+            start = time.perf_counter()
+            try:
+                profile.enable()
+                try:
+                    return target(*args, **kwargs)
+                finally:
+                    profile.disable()
+                    self.write(name, profile, time.perf_counter() - start, self.local.stages)
+            finally:
+                self.local.stages = None
+                self.lock.release()
+        return profiled
+
+    def stage(self, name, target):
+        """ (object, string, function) -> function
+        This function returns the target function timed as a stage of the profiled call it runs in.
+        """
+        if not self.enabled:
+            return target
+
+        @functools.wraps(target)
+        def timed(*args, **kwargs):
+            stages = getattr(self.local, 'stages', None)
+            if stages is None:
+                return target(*args, **kwargs)
+
+            # remember the nesting depth to indent the breakdown
+            self.local.depth = getattr(self.local, 'depth', 0) + 1
+            position = len(stages)
+            stages.append(None)
+            start = time.perf_counter()
+            try:
+                return target(*args, **kwargs)
+            finally:
+                self.local.depth -= 1
+                stages[position] = (self.local.depth, name, time.perf_counter() - start)
+        return timed
+
+    def write(self, name, profile, duration, stages):
+        """ (object, string, object, float, list) -> void
+        This function writes the profile dump (.prof) and the timing breakdown (.txt) of a profiled call
+        and removes the oldest files of the same name beyond max_dumps.
+        """
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            path = os.path.join(self.folder, f'{datetime.utcnow():%Y%m%d-%H%M%S-%f}_{name}')
+            profile.dump_stats(path + '.prof')
+
+            with open(path + '.txt', 'w') as file:
+                file.write(f'{name}: {duration * 1000:.1f} ms\n')
+                for depth, stage_name, stage_duration in stages:
+                    file.write(f'{"  " * (depth + 1)}{stage_name}: {stage_duration * 1000:.1f} ms ({stage_duration / max(duration, 1e-9):.0%})\n')
+                file.write('\n')
+
+                # slowest functions by cumulative time
+                pstats.Stats(profile, stream=file).sort_stats('cumulative').print_stats(25)
+
+            # rotate the dumps
+            for old_path in sorted(glob.glob(os.path.join(self.folder, f'*_{name}.prof')))[:-self.max_dumps]:
+                os.remove(old_path)
+                if os.path.isfile(old_path[:-5] + '.txt'):
+                    os.remove(old_path[:-5] + '.txt')
+        except Exception as err:
+            print(err)
@@ -0,0 +1,160 @@
+from datetime import datetime
+import threading
+import time
+
+
+class Scheduler:
+
+    def __init__(self, max_retries = 5, retry_delay = 10, max_retry_delay = 600, get_lag = None, metrics = None):
+        """ (object, int, int, int, function, object) -> void
+        Constructor of Scheduler. Runs registered jobs one after another in a single worker thread.
+        A failed job is retried up to max_retries times, waiting retry_delay seconds at first and twice as long
+        after every further failure (at most max_retry_delay seconds).
+        The optional get_lag function returns how far (in seconds) the data lags behind the current time.
+        The optional metrics record the duration, rows and errors of every job.
+        """
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.get_lag = get_lag
+        self.metrics = metrics
+
+        # registered jobs, jobs replaced by other jobs and periodic jobs with their next run
+        self.jobs = {}
+        self.replaces = {}
+        self.intervals = {}
+        self.next_runs = {}
+
+        # queued job names and the name of the running job
+        self.queue = []
+        self.running = None
+        self.condition = threading.Condition()
+        self.thread = None
+
+        # statistics of every job
+        self.stats = {}
+
+    def register(self, name, function, replaces = ()):
+        """ (object, string, function, tuple) -> void
+        This function registers a job. The function may return the number of imported rows.
+        Queued jobs named in replaces are dropped when this job is submitted, as this job does their work too.
+        """
+        self.jobs[name] = function
+        self.replaces[name] = list(replaces)
+        self.stats[name] = {'runs': 0, 'errors': 0, 'duration': None, 'rows': None, 'lag': None, 'finished': None}
+
+    def submit(self, name):
+        """ (object, string) -> void
+        This function queues the given job. It is merged with the same job if that is already queued
+        and dropped if a queued job replaces it.
+        """
+        with self.condition:
+            self.add(name)
+            self.condition.notify()
+
+    def add(self, name):
+        """ (object, string) -> void
+        This function queues the given job like submit, the caller has to hold the condition.
+        """
+        if name in self.queue or any(name in self.replaces[queued] for queued in self.queue):
+            return
+
+        # drop the queued jobs this job replaces
+        self.queue = [queued for queued in self.queue if not queued in self.replaces[name]]
+        self.queue.append(name)
+
+    def schedule(self, name, interval):
+        """ (object, string, int) -> void
+        This function submits the given job every interval seconds.
+        """
+        with self.condition:
+            self.intervals[name] = interval
+            self.next_runs[name] = time.monotonic() + interval
+            self.condition.notify()
+
+    def start(self):
+        """ (object) -> void
+        This function starts the worker thread.
+        """
+        with self.condition:
+            if self.thread is None:
+                self.thread = threading.Thread(target = self.run_worker, daemon = True)
+                self.thread.start()
+
+    def run_worker(self):
+        """ (object) -> void
+        This function runs the queued jobs until the software is shut down.
+        """
+        while True:
+            with self.condition:
+                while len(self.queue) == 0:
+                    # queue the periodic jobs that are due
+                    now = time.monotonic()
+                    for name in self.next_runs:
+                        if self.next_runs[name] <= now:
+                            self.next_runs[name] = now + self.intervals[name]
+                            self.add(name)
+
+                    if len(self.queue) == 0:
+                        # wait for a new job or the next periodic job
+                        timeout = min(self.next_runs.values()) - now if len(self.next_runs) > 0 else None
+                        self.condition.wait(timeout)
+
+                self.running = self.queue.pop(0)
+
+            try:
+                self.run_job(self.running)
+            finally:
+                with self.condition:
+                    self.running = None
+
+    def run_job(self, name):
+        """ (object, string) -> bool
+        This function runs the given job in the calling thread, retrying it on failure, and updates its statistics.
+        It returns true if the job succeeded.
+        """
+        delay = self.retry_delay
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                rows = self.jobs[name]()
+            except Exception as err:
+                self.stats[name]['errors'] += 1
+                if self.metrics is not None:
+                    self.metrics.increment('wettermonitor_sync_errors_total', job = name)
+                print(f'Sync job {name} failed ({err}), attempt {attempt + 1} of {self.max_retries + 1}')
+
+                # wait longer after every failure
+                if attempt < self.max_retries:
+                    time.sleep(delay)
+                    delay = min(delay * 2, self.max_retry_delay)
+                continue
+
+            self.stats[name].update({
+                'runs': self.stats[name]['runs'] + 1,
+                'duration': time.perf_counter() - start,
+                'rows': rows,
+                'lag': None if self.get_lag is None else self.get_lag(),
+                'finished': datetime.utcnow()
+            })
+            if self.metrics is not None:
+                self.metrics.observe('wettermonitor_sync_seconds', self.stats[name]['duration'], job = name)
+                self.metrics.increment('wettermonitor_sync_rows_total', rows or 0, job = name)
+            print(f'Sync job {name} took {self.stats[name]["duration"]:.1f}s, rows: {rows}, lag: {self.stats[name]["lag"]}s')
+            return True
+        return False
+
+    def is_pending(self, name):
+        """ (object, string) -> bool
+        This function returns true while the given job is queued or running.
+        """
+        with self.condition:
+            return self.running == name or name in self.queue
+
+    def get_stats(self):
+        """ (object) -> dict
+        This function returns the number of runs and errors, the last duration (in seconds), imported rows,
+        lag behind the current time (in seconds) and finishing time of every job.
+        """
+        with self.condition:
+            return {name: dict(stats) for name, stats in self.stats.items()}
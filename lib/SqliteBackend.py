@@ -0,0 +1,225 @@
+import os
+import re
+import sqlite3
+import threading
+import numpy as np
+import pandas as pd
+
+from lib.Backend import Backend
+
+
+class SqliteBackend(Backend):
+
+    def __init__(self, path = os.path.join('data', 'meteorology.sqlite')):
+        """ (object, string) -> void
+        Constructor of SqliteBackend. An embedded replacement of the influxdb server keeping all observations in one SQLite file.
+        Every station is a table with the utc time in nanoseconds as its primary key, so time ranges and the latest rows
+        are read from the index and intervals are aggregated by SQLite. Fields become columns when they are first written.
+        It is also the client the observations are written with (see write_points), e.g. by the weatherstation library.
+        """
+        folder = os.path.dirname(path)
+        if folder != '':
+            os.makedirs(folder, exist_ok=True)
+        self.path = path
+
+        # one connection for all threads (the sync writes while the frontend reads), used by one thread at a time
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.lock = threading.Lock()
+
+        # columns of every table
+        self.columns = {}
+        for (table,) in self.connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall():
+            self.columns[table] = [row[1] for row in self.connection.execute(f'PRAGMA table_info({self.quote(table)})') if row[1] != 'time']
+
+    @staticmethod
+    def quote(name):
+        """ (string) -> string
+        Returns the name quoted as an SQL identifier.
+        """
+        return '"' + str(name).replace('"', '""') + '"'
+
+    @staticmethod
+    def to_nanoseconds(date):
+        """ (object) -> int
+        Returns the given utc date as nanoseconds since 1970.
+        """
+        return pd.Timestamp(date).value
+
+    def get_fields(self, station, fields):
+        """ (object, string, list) -> list
+        Returns the given fields (None for all) the table of the station has.
+        """
+        with self.lock:
+            columns = self.columns.get(station, [])
+        return list(columns) if fields is None else [field for field in fields if field in columns]
+
+    def select(self, station, columns, fields, statement, parameters):
+        """ (object, string, list, list, string, list) -> object
+        Runs the given statement selecting the time in nanoseconds and the given columns and returns them as a dataframe
+        indexed by utc time with the fields as column names. Missing values (NULL) become nan.
+        """
+        with self.lock:
+            rows = self.connection.execute(f'SELECT time, {", ".join(columns)} FROM {self.quote(station)} {statement}', parameters).fetchall()
+
+        times = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        values = np.array([row[1:] for row in rows], dtype=np.float64).reshape(len(rows), len(fields))
+        return pd.DataFrame(values, index=pd.to_datetime(times, unit='ns', utc=True), columns=fields)
+
+    def get_any_value(self, fields):
+        """ (object, list) -> string
+        Returns the SQL condition of rows with a value of any of the given fields.
+        """
+        return '(' + ' OR '.join(f'{self.quote(field)} IS NOT NULL' for field in fields) + ')'
+
+    def get_last(self, stations, fields):
+        """ (object, list, list) -> dict
+        Returns the latest observation of every station with a value of any of the given fields (None for all fields) as a dataframe of one row.
+        """
+        result = {}
+        for station in stations:
+            station_fields = self.get_fields(station, fields)
+            if len(station_fields) == 0:
+                continue
+            data = self.select(station, [self.quote(field) for field in station_fields], station_fields,
+                f'WHERE {self.get_any_value(station_fields)} ORDER BY time DESC LIMIT 1', [])
+            if not data.empty:
+                result[station] = data
+        return result
+
+    def read_range(self, stations, fields, start_date, end_date = None, limit = None):
+        """ (object, list, list, object, object, int) -> dict
+        Returns the observations of the given fields of every station from start_date (inclusive) until end_date (exclusive, None for all),
+        oldest first and at most limit observations per station. Observations without any of the fields are left out.
+        """
+        conditions, parameters = ['time >= ?'], [self.to_nanoseconds(start_date)]
+        if end_date is not None:
+            conditions.append('time < ?')
+            parameters.append(self.to_nanoseconds(end_date))
+        limit_string = '' if limit is None else f'LIMIT {int(limit)}'
+
+        result = {}
+        for station in stations:
+            station_fields = self.get_fields(station, fields)
+            if len(station_fields) == 0:
+                continue
+            data = self.select(station, [self.quote(field) for field in station_fields], station_fields,
+                f'WHERE {" AND ".join(conditions + [self.get_any_value(station_fields)])} ORDER BY time ASC {limit_string}', parameters)
+            if not data.empty:
+                result[station] = data
+        return result
+
+    def read_windows(self, stations, fields, windows, interval = '10m', limit = None, function = 'mean'):
+        """ (object, list, list, list, string, int, string) -> list
+        Returns the mean (or the 'min', 'max' or 'count', see function) of the given fields of every station per interval ('10m', '1h' or '1d')
+        within every (start, end) window (both exclusive), as one result per window. SQLite groups the rows by their interval,
+        only the aggregations are read.
+        """
+        step = self.get_interval(interval).value
+        aggregation = {'mean': 'AVG', 'min': 'MIN', 'max': 'MAX', 'count': 'COUNT'}[function]
+        limit_string = '' if limit is None else f'LIMIT {int(limit)}'
+
+        results = []
+        for start_date, end_date in windows:
+            result = {}
+            for station in stations:
+                station_fields = self.get_fields(station, fields)
+                if len(station_fields) == 0:
+                    continue
+
+                # the time column becomes the start of the interval, intervals without any value are left out like fill(none)
+                columns = [f'{aggregation}({self.quote(field)})' for field in station_fields]
+                data = self.select(station, columns, station_fields,
+                    f'WHERE time > ? AND time < ? GROUP BY time / {step} HAVING {" + ".join(f"COUNT({self.quote(field)})" for field in station_fields)} > 0 '
+                    f'ORDER BY time / {step} ASC {limit_string}', [self.to_nanoseconds(start_date), self.to_nanoseconds(end_date)])
+                data.index = data.index.floor(pd.Timedelta(step, 'ns'))
+                if not data.empty:
+                    result[station] = data
+            results.append(result)
+        return results
+
+    def count_windows(self, station, field, windows, interval = '10m'):
+        """ (object, string, string, list, string) -> list
+        Returns the number of observations of the given field of the station per interval within every [start, end) window,
+        as one series per window indexed by the start of the intervals. SQLite counts the rows of every interval.
+        """
+        step = self.get_interval(interval).value
+        has_field = len(self.get_fields(station, [field])) == 1
+
+        results = []
+        for start_date, end_date in windows:
+            if not has_field:
+                results.append(pd.Series([], index=pd.DatetimeIndex([], tz='UTC'), dtype='int64', name=field))
+                continue
+
+            with self.lock:
+                rows = self.connection.execute(f'SELECT time / {step} * {step}, COUNT({self.quote(field)}) FROM {self.quote(station)} '
+                    f'WHERE time >= ? AND time < ? AND {self.quote(field)} IS NOT NULL GROUP BY time / {step} ORDER BY time / {step} ASC',
+                    [self.to_nanoseconds(start_date), self.to_nanoseconds(end_date)]).fetchall()
+
+            times = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+            counts = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+            results.append(pd.Series(counts, index=pd.to_datetime(times, unit='ns', utc=True), name=field))
+        return results
+
+    def query(self, query_string, **arguments):
+        """ (object, string) -> dict
+        Answers the only query the weatherstation library sends, the latest observation of a station
+        (SELECT <field or *> FROM <station> ORDER BY time DESC LIMIT 1). Other queries are not supported,
+        Database reads through the functions of Backend.
+        """
+        match = re.fullmatch(r'\s*SELECT\s+(\*|\w+)\s+FROM\s+"?(\w+)"?\s+ORDER BY time DESC LIMIT 1\s*', query_string)
+        if match is None:
+            raise ValueError(f'Unsupported query: {query_string}')
+        return self.get_last([match.group(2)], None if match.group(1) == '*' else [match.group(1)])
+
+    def write_points(self, dataframe, measurement, **arguments):
+        """ (object, object, string) -> void
+        Adds the given observations to the measurement. Values of observations of the same time are replaced,
+        missing values (nan) keep the stored ones like in influxdb.
+        """
+        if dataframe.empty:
+            return
+        index = dataframe.index if dataframe.index.tz is not None else dataframe.index.tz_localize('UTC')
+        times = index.tz_convert('UTC').tz_localize(None).to_numpy(dtype='datetime64[ns]').astype(np.int64)
+        fields = [str(field) for field in dataframe.columns]
+        values = dataframe.astype(object).where(dataframe.notna(), None)
+        rows = zip(times.tolist(), *(values[field].tolist() for field in dataframe.columns))
+
+        table = self.quote(measurement)
+        statement = f'INSERT INTO {table} (time, {", ".join(self.quote(field) for field in fields)}) ' \
+            f'VALUES ({", ".join("?" * (len(fields) + 1))}) ' \
+            f'ON CONFLICT(time) DO UPDATE SET {", ".join(f"{self.quote(field)} = COALESCE(excluded.{self.quote(field)}, {self.quote(field)})" for field in fields)}'
+
+        with self.lock, self.connection:
+            # create the table and the columns of new fields
+            columns = self.columns.get(measurement)
+            if columns is None:
+                self.connection.execute(f'CREATE TABLE IF NOT EXISTS {table} (time INTEGER PRIMARY KEY)')
+                columns = self.columns[measurement] = []
+            for field in fields:
+                if not field in columns:
+                    self.connection.execute(f'ALTER TABLE {table} ADD COLUMN {self.quote(field)} REAL')
+                    columns.append(field)
+
+            self.connection.executemany(statement, rows)
+
+    def create_database(self, name):
+        """ (object, string) -> void
+        Does nothing, there is only one embedded database.
+        """
+
+    def switch_database(self, name):
+        """ (object, string) -> void
+        Does nothing, there is only one embedded database.
+        """
+
+    def drop_database(self, name):
+        """ (object, string) -> void
+        Removes all measurements.
+        """
+        with self.lock, self.connection:
+            for measurement in self.columns:
+                self.connection.execute(f'DROP TABLE IF EXISTS {self.quote(measurement)}')
+            self.columns.clear()
@@ -0,0 +1,58 @@
+from concurrent.futures import ThreadPoolExecutor
+import re
+
+
+class StationRegistry:
+
+    def __init__(self, stations = ('mythenquai', 'tiefenbrunnen'), max_workers = 4):
+        """ (object, tuple, int) -> void
+        Constructor of StationRegistry. Holds the weather stations, i.e. the measurements of the database,
+        that are synced, queried and averaged. The queries of different stations are sent at the same time,
+        with at most max_workers queries running at once.
+        """
+        self.stations = []
+        self.max_workers = max_workers
+        for station in stations:
+            self.add(station)
+
+        # the threads are started when they are first needed and kept for the next queries
+        self.executor = ThreadPoolExecutor(max_workers = max_workers, thread_name_prefix = 'station')
+
+    def __iter__(self):
+        """ (object) -> object
+        Returns an iterator over the names of the stations.
+        """
+        return iter(list(self.stations))
+
+    def __len__(self):
+        """ (object) -> int
+        Returns the number of stations.
+        """
+        return len(self.stations)
+
+    def __contains__(self, station):
+        """ (object, string) -> bool
+        True if the given station is registered.
+        """
+        return station in self.stations
+
+    def add(self, station):
+        """ (object, string) -> void
+        This function adds a station. Its name is used as measurement name in the database,
+        so it may only contain letters, digits and underscores.
+        """
+        station = station.strip()
+        if re.fullmatch(r'\w+', station) is None:
+            raise ValueError(f'Invalid station name: {station!r}')
+        if not station in self.stations:
+            self.stations.append(station)
+
+    def map(self, function):
+        """ (object, function) -> dict
+        This function calls function with every station, at most max_workers stations at the same time,
+        and returns the results by station.
+        """
+        stations = list(self.stations)
+        if len(stations) == 1 or self.max_workers <= 1:
+            return {station: function(station) for station in stations}
+        return dict(zip(stations, self.executor.map(function, stations)))
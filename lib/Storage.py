@@ -0,0 +1,262 @@
+from datetime import datetime
+import threading
+import warnings
+import os
+import numpy as np
+import pandas as pd
+
+
+class Storage:
+
+    def __init__(self, folder = os.path.join('data', 'store'), stations = ('mythenquai', 'tiefenbrunnen'), fields = ('air_temperature', 'barometric_pressure_qfe'), origin = datetime(2006, 1, 1)):
+        """ (object, string, tuple, tuple, object) -> void
+        Constructor of Storage. Sets the folder, the stored stations and fields and the first timestamp of the grid.
+        Every field of every station is stored as one float32 file on a 10 minute grid starting at origin.
+        Timestamps are local time (Europe/Berlin) without timezone, same as the results of Database.
+        """
+        self.folder = folder
+        self.stations = list(stations)
+        self.fields = list(fields)
+        self.origin = np.datetime64(origin, 'ns')
+        self.interval = np.timedelta64(10, 'm')
+
+        # hourly and daily min, mean and max and the number of values of every field, as the number of 10 minute slots per bucket
+        self.rollups = {'1h': 6, '1d': 144}
+        self.statistics = ('min', 'mean', 'max', 'count')
+
+        # first 10 minute slot of every station changed since the rollups were last updated
+        self.changed = {}
+
+        # opened memory maps per file, reopened when the file has grown
+        self.arrays = {}
+        self.lock = threading.Lock()
+
+    def get_path(self, station, field):
+        """ (object, string, string) -> string
+        This function returns the file path of the given station and field.
+        """
+        return os.path.join(self.folder, f'{station}_{field}.f32')
+
+    def get_rollup_path(self, station, field, interval, statistic):
+        """ (object, string, string, string, string) -> string
+        This function returns the file path of the given rollup interval ('1h' or '1d') and statistic ('min', 'mean', 'max' or 'count').
+        """
+        return os.path.join(self.folder, f'{station}_{field}_{interval}_{statistic}.f32')
+
+    def get_rollup_array(self, station, field, interval, statistic):
+        """ (object, string, string, string, string) -> object
+        This function returns the read only memory map of the given rollup, one value per bucket of the grid.
+        It returns None if nothing has been stored yet.
+        """
+        return self.open_file(self.get_rollup_path(station, field, interval, statistic))
+
+    def get_array(self, station, field):
+        """ (object, string, string) -> object
+        This function returns the read only memory map of the given station and field.
+        It returns None if nothing has been stored yet.
+        """
+        return self.open_file(self.get_path(station, field))
+
+    def open_file(self, path):
+        """ (object, string) -> object
+        This function returns the read only memory map of the given file or None if it does not exist.
+        """
+        if not os.path.isfile(path):
+            return None
+
+        length = os.path.getsize(path) // 4
+        with self.lock:
+            array = self.arrays.get(path)
+
+            # (re)open the file if it is not opened yet or has grown since
+            if array is None or len(array) != length:
+                array = np.memmap(path, dtype=np.float32, mode='r', shape=(length,)) if length > 0 else np.empty(0, dtype=np.float32)
+                self.arrays[path] = array
+        return array
+
+    def get_cache_size(self):
+        """ (object) -> int
+        This function returns the size in bytes of all opened memory maps, the most memory they can hold.
+        """
+        with self.lock:
+            return sum(array.nbytes for array in self.arrays.values())
+
+    def clear_cache(self):
+        """ (object) -> void
+        This function closes all memory maps, they are opened again when needed.
+        """
+        with self.lock:
+            self.arrays.clear()
+
+    def get_positions(self, times):
+        """ (object, object) -> object, object
+        This function returns the grid positions of the given timestamps and whether they lie exactly on the grid.
+        """
+        offsets = np.asarray(times, dtype='datetime64[ns]') - self.origin
+        return offsets // self.interval, offsets % self.interval == np.timedelta64(0, 'ns')
+
+    def get_last_time(self, station = None):
+        """ (object, string) -> object
+        This function returns the last timestamp stored for the given station, or for all stations the oldest of the last timestamps of every station.
+        A station is stored up to the last timestamp of any of its fields, fields a station does not measure
+        (e.g. barometric_pressure_qfe of mythenquai) are never stored and ignored.
+        It returns None if nothing has been stored yet.
+        """
+        lengths = []
+        for station in (self.stations if station is None else [station]):
+            station_lengths = [len(array) for array in (self.get_array(station, field) for field in self.fields) if array is not None]
+            if len(station_lengths) > 0 and max(station_lengths) > 0:
+                lengths.append(max(station_lengths))
+        if len(lengths) == 0:
+            return None
+        return pd.Timestamp(self.origin + (min(lengths) - 1) * self.interval).to_pydatetime()
+
+    def write(self, station, data):
+        """ (object, string, object) -> void
+        This function writes all fields of the given station dataframe into the storage.
+        Missing values do not overwrite stored values.
+        """
+        if data is None or data.empty:
+            return
+        os.makedirs(self.folder, exist_ok=True)
+
+        positions, on_grid = self.get_positions(data.index.to_numpy())
+        for field in self.fields:
+            if not field in data:
+                continue
+            values = data[field].to_numpy(dtype=np.float32)
+            valid = on_grid & (positions >= 0) & ~np.isnan(values)
+            if not valid.any():
+                continue
+
+            self.write_file(self.get_path(station, field), positions[valid], values[valid])
+
+            # remember the changed slots to update the rollups and the analog index
+            with self.lock:
+                first_position = int(positions[valid].min())
+                self.changed[station] = min(self.changed.get(station, first_position), first_position)
+
+    def write_file(self, path, positions, values):
+        """ (object, string, object, object) -> void
+        This function writes the values at the given positions of the given file, the file grows as needed.
+        """
+        with self.lock:
+            # grow the file with missing values up to the last new position
+            length = os.path.getsize(path) // 4 if os.path.isfile(path) else 0
+            needed = int(positions.max()) + 1
+            if needed > length:
+                with open(path, 'ab') as file:
+                    file.write(np.full(needed - length, np.nan, dtype=np.float32).tobytes())
+
+            array = np.memmap(path, dtype=np.float32, mode='r+', shape=(max(length, needed),))
+            array[positions] = values
+            array.flush()
+            del array
+
+            # readers reopen the file on their next access
+            self.arrays.pop(path, None)
+
+    def read(self, station, field, start, end):
+        """ (object, string, string, object, object) -> object, object
+        This function returns the timestamps and the values of the given station and field between start and end.
+        The values are a view on the memory map, nothing is copied.
+        """
+        return self.read_file(self.get_path(station, field), self.interval, start, end)
+
+    def read_file(self, path, interval, start, end):
+        """ (object, string, object, object, object) -> object, object
+        This function returns the timestamps and a view on the values of the given file between start and end.
+        """
+        array = self.open_file(path)
+        if array is None:
+            return pd.DatetimeIndex([]), np.empty(0, dtype=np.float32)
+
+        # first position after start and last position before end
+        start_position = max(int((np.datetime64(start, 'ns') - self.origin) // interval) + 1, 0)
+        end_position = min(int(-(-(np.datetime64(end, 'ns') - self.origin) // interval)), len(array))
+        if end_position <= start_position:
+            return pd.DatetimeIndex([]), np.empty(0, dtype=np.float32)
+
+        index = pd.DatetimeIndex(self.origin + np.arange(start_position, end_position) * interval)
+        return index, array[start_position:end_position]
+
+    def read_rollup(self, station, field, interval, statistic, start, end):
+        """ (object, string, string, string, string, object, object) -> object, object
+        This function returns the start timestamps and the values of the given rollup of all buckets
+        starting between start and end. The values are a view on the memory map, nothing is copied.
+        """
+        return self.read_file(self.get_rollup_path(station, field, interval, statistic), self.interval * self.rollups[interval], start, end)
+
+    def update_rollups(self):
+        """ (object) -> dict
+        This function updates the rollups of all stations and fields.
+        Only buckets after the last complete bucket or containing changed slots are calculated again.
+        It returns the first changed 10 minute slot of every changed station.
+        """
+        with self.lock:
+            changed = self.changed
+            self.changed = {}
+
+        for station in self.stations:
+            for field in self.fields:
+                array = self.get_array(station, field)
+                if array is None or len(array) == 0:
+                    continue
+
+                for interval, slots in self.rollups.items():
+                    # continue with the last bucket, it may have been incomplete
+                    rollup = self.get_rollup_array(station, field, interval, 'count')
+                    first_bucket = 0 if rollup is None else max(len(rollup) - 1, 0)
+                    if station in changed:
+                        first_bucket = min(first_bucket, changed[station] // slots)
+                    last_bucket = -(-len(array) // slots)
+                    if last_bucket <= first_bucket:
+                        continue
+
+                    # arrange the slots as one row per bucket, fill the incomplete last bucket with nan
+                    values = np.full((last_bucket - first_bucket) * slots, np.nan, dtype=np.float32)
+                    values[:len(array) - first_bucket * slots] = array[first_bucket * slots:]
+                    values = values.reshape(-1, slots)
+
+                    positions = np.arange(first_bucket, last_bucket)
+                    with warnings.catch_warnings():
+                        # buckets without any value stay nan
+                        warnings.simplefilter('ignore', category=RuntimeWarning)
+                        results = {
+                            'min': np.nanmin(values, axis=1),
+                            'mean': np.nanmean(values, axis=1),
+                            'max': np.nanmax(values, axis=1),
+                            'count': np.count_nonzero(~np.isnan(values), axis=1)
+                        }
+
+                    # the count is written last, it tells how far the rollups are complete
+                    for statistic in self.statistics:
+                        self.write_file(self.get_rollup_path(station, field, interval, statistic), positions, results[statistic])
+
+        return changed
+
+    def get_station_mean(self, field, times):
+        """ (object, string, object) -> object
+        This function returns the mean of all stations of the given field at every given timestamp.
+        Timestamps without any stored value are nan. The result has the same shape as times.
+        """
+        positions, on_grid = self.get_positions(times)
+        total = np.zeros(positions.shape)
+        count = np.zeros(positions.shape)
+
+        for station in self.stations:
+            array = self.get_array(station, field)
+            if array is None:
+                continue
+
+            # only pick positions that exist in the file
+            valid = on_grid & (positions >= 0) & (positions < len(array))
+            values = np.full(positions.shape, np.nan)
+            values[valid] = array[positions[valid]]
+
+            present = ~np.isnan(values)
+            total += np.where(present, values, 0)
+            count += present
+
+        with np.errstate(invalid='ignore'):
+            return np.where(count > 0, total / count, np.nan)
@@ -1,86 +1,246 @@
-# import the **fixed** library
-import fhnw_ds_weatherstation_client as weather
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 import os
-import threading
-import socket
+import time
+
+from lib.Connectivity import Connectivity
+from lib.Loader import Loader
+from lib.Profiler import Profiler
+from lib.Scheduler import Scheduler
 
 
 class Sync:
-    def __init__(self):
-        """ (object) -> void
-        Contructor of Snyc. Will initialize the weatherstation api and connect to the database. 
+    def __init__(self, database = None):
+        """ (object, object) -> void
+        Contructor of Snyc. The weatherstation api is initialized and connected to the database by the first import (see connect),
+        so the software starts without waiting for them. The optional database is used to keep its local storage up to date.
         """
-        self.is_syncing = False
-        # DB and CSV config
-        self.config = weather.Config()
+        self.database = database
+
+        # functions called after new data has been imported
+        self.listeners = []
+
+        # state of the internet connection, also updated by the api requests of the sync
+        self.connectivity = Connectivity()
+
+        # weatherstation api and DB and CSV config, set by connect in the sync thread
+        self.weather = None
+        self.config = None
 
-        # connect to DB
-        weather.connect_db(self.config)
+        # show the steps of the imports in the timing breakdown of profiled sync jobs
+        profiler = Profiler() if database is None else database.profiler
+        for name in ['find_gaps', 'backfill_historic_data', 'import_latest_data', 'update_database']:
+            setattr(self, name, profiler.stage('Sync.' + name, getattr(self, name)))
+
+        # run all imports one after another in a single worker, a historic import also imports the latest data
+        self.scheduler = Scheduler(get_lag = self.get_lag, metrics = None if database is None else database.metrics)
+        self.scheduler.register('historic', profiler.wrap('sync', self.import_historic_data, 'historic'), replaces = ['latest'])
+        self.scheduler.register('latest', profiler.wrap('sync', self.import_latest_data, 'latest'))
+
+    @property
+    def is_connected(self):
+        """ (object) -> bool
+        True once the weatherstation api is connected to the database.
+        """
+        return self.config is not None
+
+    @property
+    def is_syncing(self):
+        """ (object) -> bool
+        True while historic data is waiting to be imported or being imported.
+        """
+        return self.scheduler.is_pending('historic')
 
     def import_data_async(self, historic_data = False):
         """ (object, bool) -> void
-        This function loads the latest or historing weather data. 
-        The data capturing process runs in a seperate thread.
+        This function loads the latest or historing weather data and keeps loading the latest data every 10 minutes.
+        The data capturing process runs in a seperate thread. Requests for an import that is already waiting are merged.
         """
-        # only execute if no syncing is running
-        if not self.is_syncing:
-            self.is_syncing = True
-            if historic_data:
-                # load historic and latest data in new thread
-                threading.Thread(target = self.import_historic_data, args = [True]).start()
-            else:
-                # load latest data in new thread
-                threading.Thread(target = self.import_latest_data, args = [True]).start()
+        # load historic and latest data or only latest data in the sync thread
+        self.scheduler.submit('historic' if historic_data else 'latest')
 
-    def import_historic_data(self, periodic = False):
-        """ (object, bool) -> void
-        This function loads the latest or historing weather data. 
-        The data capturing process runs in a seperate thread.
+        # load latest data periodically
+        self.scheduler.schedule('latest', 600)
+        self.scheduler.start()
+
+    def connect(self, retry_delay = 5):
+        """ (object, int) -> void
+        This function imports the weatherstation api and connects it to the database. It runs in the sync thread before the first import
+        and waits until the database server answers, it may still be starting after a reboot. Once connected, it does nothing.
+        """
+        if self.config is not None:
+            return
+
+        # import the **fixed** library, it takes a while to import
+        import fhnw_ds_weatherstation_client as weather
+
+        # DB and CSV config, the stations of the station registry are synced
+        config = weather.Config()
+        if self.database is not None:
+            config.stations = list(self.database.stations)
+
+        # an embedded backend (see Database) also receives the imported data, otherwise connect to the influxdb server
+        shared_client = None if self.database is None else self.database.connection.shared_client
+        while True:
+            config.client = shared_client
+            try:
+                # connect to DB
+                weather.connect_db(config)
+                break
+            except Exception as err:
+                print(f'Could not connect to the database ({err}), trying again in {retry_delay}s')
+                time.sleep(retry_delay)
+
+        self.weather = weather
+        self.config = config
+
+    def import_historic_data(self):
+        """ (object) -> int
+        This function loads the historic and the latest weather data.
+        It returns the number of backfilled rows or None if the number is unknown.
         """
+        rows = None
+        gaps = None
+        self.connect()
+
         # check if the database is up to date
-        if not weather.db_is_up_to_date(self.config):
+        if not self.weather.db_is_up_to_date(self.config):
             print('Syncing historic data...')
 
-            # wipe the database for a fresh start
-            weather.clean_db(self.config)
-            
-            # import historic data
-            weather.import_historic_data(self.config)
+            # find the missing observations of every station
+            gaps = self.find_gaps()
+
+            if gaps is None:
+                # wipe the database for a fresh start
+                self.weather.clean_db(self.config)
+
+                # import historic data
+                self.weather.import_historic_data(self.config)
+            else:
+                # only import the missing observations
+                rows = self.backfill_historic_data(gaps)
         else:
             print('Historic data already synced.')
 
-        # import latest data (delta between last data point in DB and current time)
-        self.import_latest_data()
-        if periodic:
-            self.import_latest_data(True)
+        # fill the local storage with the historic data, including the backfilled gaps
+        self.update_database(gaps)
 
-    def import_latest_data(self, periodic = False):
-        """ (object, bool) -> void
+        try:
+            # import latest data (delta between last data point in DB and current time)
+            latest_rows = self.import_latest_data()
+        except Exception:
+            # the historic data is imported, only retry the latest data
+            self.scheduler.submit('latest')
+            latest_rows = None
+        return latest_rows if rows is None else rows + (latest_rows or 0)
+
+    def find_gaps(self):
+        """ (object) -> dict
+        This function returns the missing observations of every station as utc (start, end) ranges, see Database.get_gaps.
+        It returns None if there is no database or a station has no observations at all.
+        """
+        if self.database is None:
+            return None
+
+        # look for gaps of all stations at the same time
+        gaps = self.database.stations.map(self.database.get_gaps)
+
+        if any(station_gaps is None for station_gaps in gaps.values()):
+            return None
+        return gaps
+
+    def backfill_historic_data(self, gaps):
+        """ (object, dict) -> int
+        This function imports the missing observations of every station (see find_gaps) from the CSV files.
+        All stations are imported at the same time. Observations newer than the CSV files are imported by import_latest_data.
+        It returns the number of imported rows.
+        """
+        loader = Loader(self.database.connection, self.config.historic_data_folder, max_workers = len(gaps))
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers = len(gaps)) as executor:
+            rows = sum(executor.map(lambda station: self.backfill_station(loader, station, gaps[station]), gaps))
+
+        duration = time.perf_counter() - start
+        print(f'Backfilled {rows} observations in {duration:.1f}s ({rows / max(duration, 1e-9):.0f} rows/s)')
+
+        # the weatherstation library has to read the last observations from the database again
+        self.config.stations_last_entries.clear()
+        return rows
+
+    def backfill_station(self, loader, station, gaps):
+        """ (object, object, string, list) -> int
+        This function imports the missing observations of the given station and returns the number of imported rows.
+        """
+        missing = sum((end_date - start_date).total_seconds() // 600 for start_date, end_date in gaps)
+        print(f'Found {len(gaps)} gaps with {missing:.0f} missing observations for {station}')
+        if len(gaps) == 0:
+            return 0
+
+        return sum(loader.load_file(path, station, gaps) for path, file_station in loader.get_files() if file_station == station)
+
+    def import_latest_data(self):
+        """ (object) -> int
         This function loads the latest weather data from the api.
+        It returns the number of new observations per station or None if it is unknown.
+        Raises an exception if the api could not be reached, so the import is retried.
         """
+        self.connect()
+        last_time = self.get_last_time()
         try:
             # import latest data (delta between last data point in DB and current time)
-            weather.import_latest_data(self.config, True, periodic)
+            self.weather.import_latest_data(self.config, True)
+            self.connectivity.report(True)
         except AttributeError as err:
             print(err)
         except Exception as err:
             print("No Internet")
+            self.connectivity.report(False)
+            raise
+
+        # append the new data to the local storage and drop cached observations
+        self.update_database()
+
+        new_last_time = self.get_last_time()
+        if last_time is None or new_last_time is None:
+            return None
+        return int((new_last_time - last_time).total_seconds() // 600)
+
+    def get_last_time(self):
+        """ (object) -> object
+        This function returns the local time of the newest observation in the database or None if it is unknown.
+        """
+        if self.database is None:
+            return None
+        return self.database.get_snapshot()['time']
+
+    def get_lag(self):
+        """ (object) -> float
+        This function returns how many seconds the newest observation lags behind the current time or None if it is unknown.
+        """
+        last_time = self.get_last_time()
+        if last_time is None:
+            return None
+        return (self.database.to_local_time(datetime.utcnow()) - last_time).total_seconds()
 
-        # allow for new syncing to take place, loading historic and latest data will always end here
-        self.is_syncing = False
+    def update_database(self, gaps = None):
+        """ (object, dict) -> void
+        This function tells the database and the listeners that new data has been imported.
+        It appends the new data and the given backfilled gaps (see find_gaps) to the local storage and drops the cached latest observations.
+        The listeners are called with the first changed 10 minute slot of every changed station of the local storage (see Database.update_storage).
+        Raises an exception if the local storage could not be updated, so the import is retried.
+        """
+        if self.database is None:
+            return
+        self.database.invalidate_snapshot()
+        changed = self.database.update_storage(gaps)
+
+        for listener in self.listeners:
+            listener(changed)
 
     def has_internet_connection(self):
         """ (object) -> bool
         This function returns true if there is a connection to the internet.
+        It returns the last known state without waiting, see Connectivity.
         """
-        try:
-            # check if host is reachable
-            host = socket.gethostbyname("1.1.1.1")
-
-            # connect to the host -- tells us if the host is actually reachable
-            socket_connection = socket.create_connection((host, 80), 2)
-            socket_connection.close()
-            return True
-        except:
-            pass
-        return False       
\ No newline at end of file
+        return self.connectivity.is_connected()
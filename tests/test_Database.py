@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+
+from lib.Database import Database
+from lib.FakeClient import FakeClient
+from lib.Storage import Storage
+
+
+class TestUpdateStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.data = FakeClient.generate_data(datetime.utcnow().year - 2)
+        self.folders = [tempfile.TemporaryDirectory() for _ in range(2)]
+        self.client = FakeClient(self.data)
+        self.database = Database(client = self.client, storage = Storage(self.folders[0].name))
+
+        # a database that never fails to compare with
+        self.reference = Database(client = FakeClient(self.data), storage = Storage(self.folders[1].name))
+        self.reference.update_storage()
+
+    def tearDown(self):
+        for folder in self.folders:
+            folder.cleanup()
+
+    def assert_storage_equal(self):
+        start, end = self.reference.storage.origin, datetime.utcnow() + timedelta(days=1)
+        for station in self.reference.storage.stations:
+            for field in self.reference.storage.fields:
+                _, expected = self.reference.storage.read(station, field, start, end)
+                _, values = self.database.storage.read(station, field, start, end)
+                np.testing.assert_array_equal(values, expected, err_msg=f'{station} {field}')
+
+    def test_failed_chunk_is_read_again(self):
+        read_range = self.database.backend.read_range
+        failed = datetime.utcnow() - timedelta(days=400)
+        calls = []
+
+        # fail the chunk of one station a bit more than a year ago once
+        def fail_once(stations, fields, start_date, end_date = None, limit = None):
+            if stations == ['tiefenbrunnen'] and start_date <= failed < end_date and len(calls) == 0:
+                calls.append(start_date)
+                raise ConnectionError('connection lost')
+            return read_range(stations, fields, start_date, end_date, limit)
+        self.database.backend.read_range = fail_once
+
+        with self.assertRaises(RuntimeError):
+            self.database.update_storage()
+        self.assertEqual(len(calls), 1)
+
+        self.database.update_storage()
+        self.assert_storage_equal()
+
+    def test_failed_gap_is_read_again(self):
+        gap = (datetime.utcnow() - timedelta(days=200), datetime.utcnow() - timedelta(days=199))
+        station = 'mythenquai'
+
+        # the observations of the gap are missing until they are backfilled
+        data = self.data[station]
+        in_gap = (data.index >= pd.Timestamp(gap[0], tz='UTC')) & (data.index < pd.Timestamp(gap[1], tz='UTC'))
+        self.client.measurements[station] = data[~in_gap]
+        self.database.update_storage()
+        self.client.write_points(data[in_gap], station)
+
+        read_range = self.database.backend.read_range
+        def fail(stations, fields, start_date, end_date = None, limit = None):
+            raise ConnectionError('connection lost')
+        self.database.backend.read_range = fail
+        with self.assertRaises(RuntimeError):
+            self.database.update_storage({station: [gap]})
+
+        # the next update reads the gap without it being given again
+        self.database.backend.read_range = read_range
+        self.database.update_storage()
+        self.assert_storage_equal()
+
+
+if __name__ == '__main__':
+    unittest.main()